@@ -0,0 +1,215 @@
+import os
+import json
+import warnings
+import numpy as np
+
+from activevision.scene_annotations import SceneAnnotations, SceneCategoryBoxes
+from activevision.utils.cache_utils import get_cache_dir, is_cache_valid, read_cache_meta, \
+    directory_sources
+from activevision.utils.matlab_utils import load_mat
+from activevision.defaults import SCENE_ANNOTATIONS_FNAME, ALL_SCENES, CATEGORY_FOLDER, \
+    CATEGORY_BOXES_FOLDER
+
+ANNOTATIONS_CACHE_NAME = 'annotations'
+ANNOTATIONS_CACHE_VERSION = 1
+CATEGORY_PACK_NAME = 'category_boxes'
+CATEGORY_PACK_VERSION = 1
+
+
+def compile_scene_cache(data_root, scene, cache_root=None):
+    """ Compile annotations.json of a scene into a memory mappable columnar cache.
+
+    Parameters
+    ----------
+    data_root: str
+        Root of the Active Vision Dataset.
+    scene: str
+        Name of the scene.
+    cache_root: str or None, default=None
+        Root folder for all caches. See *get_cache_dir*.
+
+    Returns
+    -------
+    str
+        Directory of the compiled cache.
+    """
+    ann_file_path = os.path.join(data_root, scene, SCENE_ANNOTATIONS_FNAME)
+    with open(ann_file_path, 'r') as f:
+        annotations = json.load(f)
+
+    cache_dir = get_cache_dir(data_root, scene, ANNOTATIONS_CACHE_NAME, cache_root=cache_root)
+    SceneAnnotations.from_json(annotations, scene=scene).save(
+        cache_dir, sources=[ann_file_path], version=ANNOTATIONS_CACHE_VERSION)
+    return cache_dir
+
+
+def load_scene_cache(data_root, scene, cache_root=None, mmap_mode='r'):
+    """ Load compiled annotations of a scene, compiling them first if missing or stale.
+
+        The cache is stale when the modification time or size of the scene's annotations.json
+    differs from the one it was compiled from.
+
+    Parameters
+    ----------
+    data_root: str
+        Root of the Active Vision Dataset.
+    scene: str
+        Name of the scene.
+    cache_root: str or None, default=None
+        Root folder for all caches. See *get_cache_dir*.
+    mmap_mode: str or None, default='r'
+        Memory map mode of the cached arrays.
+
+    Returns
+    -------
+    SceneAnnotations
+    """
+    ann_file_path = os.path.join(data_root, scene, SCENE_ANNOTATIONS_FNAME)
+    cache_dir = get_cache_dir(data_root, scene, ANNOTATIONS_CACHE_NAME, cache_root=cache_root)
+
+    if not is_cache_valid(cache_dir, sources=[ann_file_path], version=ANNOTATIONS_CACHE_VERSION):
+        compile_scene_cache(data_root, scene, cache_root=cache_root)
+
+    return SceneAnnotations.load(cache_dir, mmap_mode=mmap_mode)
+
+
+def read_category_mat(ann_path):
+    """ Read category bounding boxes of an image from its .mat annotation file.
+
+    Parameters
+    ----------
+    ann_path: str
+        Path of the .mat file.
+
+    Returns
+    -------
+    boxes: list
+        List of [x1, y1, x2, y2, category_id] for each box.
+    category_names: list
+        Category name of each box.
+    """
+    boxes = []
+    category_names = []
+
+    mat_content = load_mat(ann_path)['bboxes']
+    # Skip if there are no bounding boxes
+    if len(mat_content) == 0:
+        return boxes, category_names
+
+    for obj in mat_content[0]:
+        x1 = int(np.squeeze(obj[4]))
+        y1 = int(np.squeeze(obj[3]))
+        x2 = int(np.squeeze(obj[6]))
+        y2 = int(np.squeeze(obj[5]))
+        obj_cat_id = int(np.squeeze(obj[1]))
+        boxes.append([x1, y1, x2, y2, obj_cat_id])
+        category_names.append(str(np.squeeze(obj[0])))
+
+    return boxes, category_names
+
+
+def compile_category_pack(data_root, scene, cache_root=None):
+    """ Pack category bounding boxes of all images of a scene into a single set of arrays.
+
+        Reads every .mat file in the scene's category bounding box folder once and stores the
+    boxes, category ids, per image offsets and the category id to name table. See
+    *SceneCategoryBoxes* for the layout.
+
+    Parameters
+    ----------
+    data_root: str
+        Root of the Active Vision Dataset.
+    scene: str
+        Name of the scene.
+    cache_root: str or None, default=None
+        Root folder for all caches. See *get_cache_dir*.
+
+    Returns
+    -------
+    str
+        Directory of the compiled pack.
+    """
+    bboxes_path = os.path.join(data_root, CATEGORY_FOLDER, scene, CATEGORY_BOXES_FOLDER)
+    image_names = []
+    image_boxes = []
+    category_id2name_map = dict()
+
+    for mat_name in sorted(os.listdir(bboxes_path)):
+        if not mat_name.endswith('.mat'):
+            continue
+        boxes, category_names = read_category_mat(os.path.join(bboxes_path, mat_name))
+        for box, name in zip(boxes, category_names):
+            assert category_id2name_map.setdefault(box[4], name) == name, \
+                f'Category id to name mismatch for {mat_name}!'
+        image_names.append(mat_name.split('.')[0] + '.jpg')
+        image_boxes.append(boxes)
+
+    cache_dir = get_cache_dir(data_root, scene, CATEGORY_PACK_NAME, cache_root=cache_root)
+    SceneCategoryBoxes.from_lists(image_names, image_boxes, category_id2name_map).save(
+        cache_dir, sources=directory_sources(bboxes_path, '.mat'), version=CATEGORY_PACK_VERSION)
+    return cache_dir
+
+
+def category_pack_exists(data_root, scene, cache_root=None):
+    cache_dir = get_cache_dir(data_root, scene, CATEGORY_PACK_NAME, cache_root=cache_root)
+    meta = read_cache_meta(cache_dir)
+    return meta is not None and meta.get('version') == CATEGORY_PACK_VERSION
+
+
+def load_category_pack(data_root, scene, cache_root=None, mmap_mode='r'):
+    """ Load packed category bounding boxes of a scene.
+
+        Unlike the annotation cache, the pack is not compiled automatically as it requires reading
+    every annotation file of the scene. The pack is stale if any .mat file of the scene was added,
+    removed or modified after it was compiled. Stale packs are never returned; a warning is raised
+    and None is returned so that the boxes are read from the .mat files instead.
+
+    Parameters
+    ----------
+    data_root: str
+        Root of the Active Vision Dataset.
+    scene: str
+        Name of the scene.
+    cache_root: str or None, default=None
+        Root folder for all caches. See *get_cache_dir*.
+    mmap_mode: str or None, default='r'
+        Memory map mode of the packed arrays.
+
+    Returns
+    -------
+    SceneCategoryBoxes or None
+        None if no pack has been compiled for the scene or the pack is stale.
+    """
+    if not category_pack_exists(data_root, scene, cache_root=cache_root):
+        return None
+
+    cache_dir = get_cache_dir(data_root, scene, CATEGORY_PACK_NAME, cache_root=cache_root)
+    bboxes_path = os.path.join(data_root, CATEGORY_FOLDER, scene, CATEGORY_BOXES_FOLDER)
+    if not is_cache_valid(cache_dir, sources=directory_sources(bboxes_path, '.mat'),
+                          version=CATEGORY_PACK_VERSION):
+        warnings.warn(f'Category boxes of {scene} changed after they were packed in {cache_dir}.'
+                      f' Reading .mat files instead. Recompile with compile_category_pack.')
+        return None
+
+    return SceneCategoryBoxes.load(cache_dir, mmap_mode=mmap_mode)
+
+
+if __name__ == '__main__':
+    import argparse
+    from activevision.defaults import AVD_DATASET
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenes', '-s', type=str, nargs='*', default=ALL_SCENES,
+                        help='Scenes to compile. Compiles all scenes by default.')
+    parser.add_argument('--cache-root', type=str, default=None,
+                        help='Root folder for caches. Defaults to a folder inside the dataset.')
+    parser.add_argument('--categories', action='store_true',
+                        help='Also pack category bounding boxes of the scenes.')
+
+    args = parser.parse_args()
+
+    for s in args.scenes:
+        print(f'Compiled {s} in {compile_scene_cache(AVD_DATASET, s, cache_root=args.cache_root)}')
+        if args.categories:
+            pack_dir = compile_category_pack(AVD_DATASET, s, cache_root=args.cache_root)
+            print(f'Packed category boxes of {s} in {pack_dir}')
@@ -1,18 +1,56 @@
 import os
 import json
+from functools import partial
 import numpy as np
 
-from activevision.utils.matlab_utils import load_mat
+from activevision.annotation_cache import load_scene_cache, load_category_pack, \
+    category_pack_exists, read_category_mat
+from activevision.utils.parallel_utils import parallel_map
+from activevision.utils.lru_cache import LRUCache
+from activevision.scene_annotations import SceneAnnotations, SceneCategoryBoxes, segment_pairs
+from activevision.navigation import NavigationGraph
+from activevision.utils.box_ops import paired_iou
 from activevision.defaults import SCENE_ANNOTATIONS_FNAME, ALL_SCENES, ALL_DIRECTIONS, \
-    LABEL_MAP_FNAME, IMG_FOLDER
+    LABEL_MAP_FNAME, IMG_FOLDER, DEPTH_FOLDER, CATEGORY_FOLDER, CATEGORY_BOXES_FOLDER
 
 
 class AVDAnnotations:
-    def __init__(self, data_root):
+    def __init__(self, data_root, use_cache=False, cache_root=None, lazy=False, max_scenes=None,
+                 max_bytes=None):
+        """ Instance annotations of Active Vision Dataset.
+
+        Parameters
+        ----------
+        data_root: str
+            Root of the Active Vision Dataset.
+        use_cache: bool, default=False
+            Flag to load scenes from compiled, memory mapped caches instead of parsing json files.
+            Caches are compiled on first use and recompiled when annotations.json changes.
+        cache_root: str or None, default=None
+            Root folder for compiled caches. Uses a folder inside `data_root` when None.
+        lazy: bool, default=False
+            Flag to load scenes on first access instead of in *load_annotations*. Resident scenes
+            are kept in a least recently used cache bounded by `max_scenes` and `max_bytes`.
+        max_scenes: int or None, default=None
+            Maximum number of resident scenes in lazy mode. Unbounded when None.
+        max_bytes: int or None, default=None
+            Maximum estimated memory of resident scenes in lazy mode. Unbounded when None. Arrays
+            memory mapped from the compiled cache are not counted, see *deep_sizeof*.
+        """
         self.data_root = data_root
-        self.annotations = dict()  # Scene: {'img_name1': {...}, ... }
+        self.use_cache = use_cache
+        self.cache_root = cache_root
+        self.lazy = lazy
+        self.max_scenes = max_scenes
+        self.max_bytes = max_bytes
+        if lazy:
+            self.annotations = LRUCache(loader=self._load_scene, max_items=max_scenes,
+                                        max_bytes=max_bytes)
+        else:
+            self.annotations = dict()  # Scene: SceneAnnotations
         self.loaded_scenes = []
         self.instance_id2name_map = self._load_label_map()
+        self.instance_name_table = id2name_table(self.instance_id2name_map)
 
     def __str__(self):
         return f'AVD Instance Annotations. Scenes: {self.loaded_scenes}'
@@ -29,7 +67,7 @@ class AVDAnnotations:
         del label_map_json
         return instance_id2name_map
 
-    def load_annotations(self, scenes=None):
+    def load_annotations(self, scenes=None, workers=None):
         """ Load annotations for specified scenes.
 
             Load annotations for specified scenes and add the scene name(s) to
@@ -42,10 +80,19 @@ class AVDAnnotations:
             List of scenes to load. All specified scenes must be present in list
         of available scenes by default in *activevision*. Loads all scenes when
         None.
+        workers: int or None, default=None
+            Number of workers to load scenes concurrently. Json files are parsed
+        in a process pool while compiled caches are mapped in a thread pool.
+        Scenes are loaded sequentially when None.
 
         Returns
         -------
         None
+
+        Notes
+        -----
+            In lazy mode, scenes are only added to the list of loaded scenes
+        here and their annotations are loaded on first access.
         """
         # Load all scenes by default
         if scenes is None or (type(scenes) == list and len(scenes) == 0):
@@ -55,13 +102,37 @@ class AVDAnnotations:
         for scene in scenes:
             assert scene in ALL_SCENES, f'Specified scene not available in default scenes: {scene}'
 
+        if self.lazy:
+            for scene in scenes:
+                if scene not in self.loaded_scenes:
+                    self.loaded_scenes.append(scene)
+            return
+
         # Load parameters for each scene and concatenate
-        for scene in scenes:
-            ann_file_path = os.path.join(self.data_root, scene, SCENE_ANNOTATIONS_FNAME)
-            with open(ann_file_path, 'r') as f:
-                annotations = json.load(f)
+        load_fn = partial(_load_scene_annotations, data_root=self.data_root,
+                          use_cache=self.use_cache, cache_root=self.cache_root)
+        all_annotations = parallel_map(load_fn, scenes, workers=workers,
+                                       executor='thread' if self.use_cache else 'process')
+
+        for scene, annotations in zip(scenes, all_annotations):
             self.annotations[scene] = annotations
-            self.loaded_scenes.append(scene)
+            if scene not in self.loaded_scenes:
+                self.loaded_scenes.append(scene)
+
+    def _load_scene(self, scene):
+        return _load_scene_annotations(scene, data_root=self.data_root, use_cache=self.use_cache,
+                                       cache_root=self.cache_root)
+
+    def residency_stats(self):
+        """ Get hit, miss and eviction counters of resident scenes in lazy mode.
+
+        Returns
+        -------
+        dict
+            Counters of the scene cache. See *LRUCache.stats*.
+        """
+        assert self.lazy, 'Residency stats are only available in lazy mode.'
+        return self.annotations.stats()
 
     def get_neighbor_image(self, scene, img_name, direction):
         assert scene in self.loaded_scenes, f'Specified scene is not loaded: {scene}'
@@ -69,21 +140,49 @@ class AVDAnnotations:
             f'Direction {direction} not in list of available directions\n' \
             f'Possible directions:\n{ALL_DIRECTIONS}'
 
-        return self.annotations[scene][img_name][direction]
+        scene_ann = self.annotations[scene]
+        neighbor_idx = scene_ann.neighbors[scene_ann.name2idx[img_name],
+                                           ALL_DIRECTIONS.index(direction)]
+        return str(scene_ann.image_names[neighbor_idx]) if neighbor_idx >= 0 else ''
+
+    def get_navigation_graph(self, scene):
+        """ Get integer transition table of a scene for batched navigation. See *NavigationGraph*.
+        """
+        assert scene in self.loaded_scenes, f'Specified scene is not loaded: {scene}'
+
+        return NavigationGraph.from_scene_annotations(self.annotations[scene])
 
     def get_image_boxes_raw(self, scene, img_name):
+        """ Get (num_boxes, 6) view of [x1, y1, x2, y2, instance_id, difficulty] boxes. """
         assert scene in self.loaded_scenes, f'Specified scene is not loaded: {scene}'
 
-        return self.annotations[scene][img_name]['bounding_boxes']
+        scene_ann = self.annotations[scene]
+        return scene_ann.image_boxes(scene_ann.name2idx[img_name])
 
     def get_image_boxes(self, scene, img_name):
+        """ Get instance bounding boxes of an image.
+
+            Boxes, ids and difficulties are views of the scene's box array and must not be modified.
+            Empty lists are returned for images without boxes.
+
+        Parameters
+        ----------
+        scene: str
+            Scene where the image is located.
+        img_name: str
+            Name of the image (with .jpg)
+
+        Returns
+        -------
+        dict
+            'instance_boxes', 'instance_ids', 'instance_difficulties', 'instance_names'
+        """
         boxes_raw = self.get_image_boxes_raw(scene=scene, img_name=img_name)
         if len(boxes_raw) != 0:
-            boxes_raw = np.array(boxes_raw)
             boxes = boxes_raw[:, :4]
             instance_ids = boxes_raw[:, 4]
             difficulties = boxes_raw[:, 5]
-            instance_names = [self.instance_id2name(i) for i in instance_ids]
+            instance_names = self.instance_name_table[instance_ids].tolist()
         else:
             boxes = []
             instance_ids = []
@@ -92,13 +191,46 @@ class AVDAnnotations:
         return {'instance_boxes': boxes, 'instance_ids': instance_ids,
                 'instance_difficulties': difficulties, 'instance_names': instance_names}
 
+    def get_boxes_batch(self, scene, image_ids):
+        """ Get instance bounding boxes of many images of a scene in one call.
+
+        Parameters
+        ----------
+        scene: str
+            Scene where the images are located.
+        image_ids: list or numpy array
+            Indices of the images in the scene (see *image2idx*) or their names.
+
+        Returns
+        -------
+        dict
+            'instance_boxes': (num_boxes, 4), 'instance_ids': (num_boxes,) and
+            'instance_difficulties': (num_boxes,) arrays and 'instance_names' list, like
+            *get_image_boxes*, of boxes of all images concatenated in input order and
+            'box_offsets': (len(image_ids)+1,) such that boxes of the i-th image are at
+            [box_offsets[i]:box_offsets[i+1]].
+        """
+        assert scene in self.loaded_scenes, f'Specified scene is not loaded: {scene}'
+
+        scene_ann = self.annotations[scene]
+        image_ids = [scene_ann.name2idx[i] if isinstance(i, str) else i for i in image_ids]
+        boxes_raw, offsets = scene_ann.image_boxes_batch(image_ids)
+
+        return {'instance_boxes': boxes_raw[:, :4], 'instance_ids': boxes_raw[:, 4],
+                'instance_difficulties': boxes_raw[:, 5],
+                'instance_names': self.instance_name_table[boxes_raw[:, 4]].tolist(),
+                'box_offsets': offsets}
+
     def idx2image(self, scene, idx):
-        scene_images = list(self.annotations[scene].keys())
+        scene_images = self.annotations[scene].image_names
         if idx >= len(scene_images):
             raise IndexError(
                 f'Index {idx} is greater than number of images {len(scene_images)} in {scene}.')
 
-        return scene_images[idx]
+        return str(scene_images[idx])
+
+    def image2idx(self, scene, img_name):
+        return self.annotations[scene].name2idx[img_name]
 
     def instance_id2name(self, idx):
         return self.instance_id2name_map[idx]
@@ -106,13 +238,24 @@ class AVDAnnotations:
     def img_name2path(self, scene, name):
         return os.path.join(self.data_root, scene, IMG_FOLDER, name)
 
+    def img_name2depth_path(self, scene, name):
+        return os.path.join(self.data_root, scene, DEPTH_FOLDER, img_name2depth_name(name))
+
 
 class AVDCategoryAnns(AVDAnnotations):
-    def __init__(self, data_root):
-        super().__init__(data_root)
-        self.category_ann_path = os.path.join(self.data_root, 'AVD_Category_Bboxes')
+    def __init__(self, data_root, use_cache=False, cache_root=None, lazy=False, max_scenes=None,
+                 max_bytes=None):
+        super().__init__(data_root, use_cache=use_cache, cache_root=cache_root, lazy=lazy,
+                         max_scenes=max_scenes, max_bytes=max_bytes)
+        self.category_ann_path = os.path.join(self.data_root, CATEGORY_FOLDER)
         self.available_scenes = self._check_available_scenes()
+        if lazy:
+            self.category_annotations = LRUCache(loader=self._load_category_scene,
+                                                 max_items=max_scenes, max_bytes=max_bytes)
+        else:
+            self.category_annotations = dict()  # Scene: SceneCategoryBoxes
         self.category_id2name_map = dict()
+        self.category_name_table = id2name_table(self.category_id2name_map)
 
     def __str__(self):
         return f'AVD Instance Annotations. Scenes: {self.loaded_scenes}'
@@ -124,18 +267,24 @@ class AVDCategoryAnns(AVDAnnotations):
                 avail_scenes.append(i)
         return avail_scenes
 
-    def load_annotations(self, scenes=None):
+    def load_annotations(self, scenes=None, workers=None):
         """ Load annotations for both instances and categories.
             First, loads the instance annotations using it's parent class. Then,
-            for each image in the loaded annotations, searches for category
-            annotation file. *Skips* image annotation if respective annotation
-            file is not found and *adds empty list* if no annotation file is
-            empty.
+            loads category annotations from the packed category boxes of the
+            scene if they have been compiled (see *compile_category_pack*).
+            Otherwise, for each image in the loaded annotations, searches for
+            category annotation file. *Skips* image annotation if respective
+            annotation file is not found and *adds empty list* if no annotation
+            file is empty.
         Parameters
         ----------
         scenes: list, None, default=None
             List of scenes for which annotations are to be loaded. If not
             specified, loads for all available instances of default.
+        workers: int or None, default=None
+            Number of workers to load scenes concurrently. See parent class.
+            Category annotation files are parsed in a process pool unless all
+            scenes are packed.
 
         Returns
         -------
@@ -151,42 +300,53 @@ class AVDCategoryAnns(AVDAnnotations):
             assert i in self.available_scenes, f'Category annotations not available for {i}'
 
         # Load instance annotations
-        super().load_annotations(scenes=scenes)
+        super().load_annotations(scenes=scenes, workers=workers)
+        if self.lazy:
+            return
 
         # Add category annotation for each image
-        for scene in self.annotations:
-            scene_ann = self.annotations[scene]
-            for img_name in scene_ann:
-                mat_name = img_name.split('.')[0] + '.mat'
-                ann_path = os.path.join(self.category_ann_path, scene, 'bboxes', mat_name)
-
-                if os.path.isfile(ann_path):
-                    scene_ann[img_name]['cat_bounding_boxes'] = img_ann = []
-
-                    mat_content = load_mat(ann_path)['bboxes']
-                    # Skip if there are no bounding boxes
-                    if len(mat_content) == 0:
-                        continue
-
-                    mat_content = mat_content[0]
-                    # print(mat_content.dtype.names)
-                    for obj in mat_content:
-                        obj = obj
-                        obj_cat = str(np.squeeze(obj[0]))
-                        x1 = int(np.squeeze(obj[4]))
-                        y1 = int(np.squeeze(obj[3]))
-                        x2 = int(np.squeeze(obj[6]))
-                        y2 = int(np.squeeze(obj[5]))
-                        obj_cat_id = int(np.squeeze(obj[1]))
-                        img_ann.append([x1, y1, x2, y2, obj_cat_id])
-
-                        # TODO: Add separate file for category label mapping
-                        # Check integrity of object id to name
-                        if obj_cat_id not in self.category_id2name_map:
-                            self.category_id2name_map[obj_cat_id] = obj_cat
-                        else:
-                            assert self.category_id2name_map[obj_cat_id] == obj_cat, \
-                                f'Category id to name mismatch for {img_name}!'
+        packed = all(category_pack_exists(self.data_root, i, cache_root=self.cache_root)
+                     for i in scenes)
+        load_fn = partial(_load_scene_category_boxes, data_root=self.data_root,
+                          cache_root=self.cache_root)
+        all_category_boxes = parallel_map(
+            load_fn, [(i, list(self.annotations[i].keys())) for i in scenes], workers=workers,
+            executor='thread' if packed else 'process')
+
+        for scene, (scene_cat_ann, category_id2name_map) in zip(scenes, all_category_boxes):
+            self._update_category_map(category_id2name_map, scene)
+            self.category_annotations[scene] = scene_cat_ann
+
+    def _load_category_scene(self, scene):
+        scene_cat_ann, category_id2name_map = _load_scene_category_boxes(
+            (scene, list(self.annotations[scene].keys())), data_root=self.data_root,
+            cache_root=self.cache_root)
+        self._update_category_map(category_id2name_map, scene)
+        return scene_cat_ann
+
+    def residency_stats(self):
+        """ Get counters of resident instance and category annotations in lazy mode.
+
+        Returns
+        -------
+        dict
+            'instances' and 'categories' counters. See *LRUCache.stats*.
+        """
+        return {'instances': super().residency_stats(),
+                'categories': self.category_annotations.stats()}
+
+    def _update_category_map(self, category_id2name_map, source):
+        # Check integrity of object id to name
+        updated = False
+        for obj_cat_id, obj_cat in category_id2name_map.items():
+            if obj_cat_id not in self.category_id2name_map:
+                self.category_id2name_map[obj_cat_id] = obj_cat
+                updated = True
+            else:
+                assert self.category_id2name_map[obj_cat_id] == obj_cat, \
+                    f'Category id to name mismatch for {source}!'
+        if updated:
+            self.category_name_table = id2name_table(self.category_id2name_map)
 
     def category_id2name(self, idx):
         return self.category_id2name_map[idx]
@@ -231,19 +391,185 @@ class AVDCategoryAnns(AVDAnnotations):
             cat_ids = []
             category_names = []
 
-            if 'cat_bounding_boxes' in self.annotations[scene][img_name]:
-                cat_boxes_raw = self.annotations[scene][img_name]['cat_bounding_boxes']
-                if len(cat_boxes_raw) != 0:
-                    cat_boxes_raw = np.array(cat_boxes_raw)
-                    cat_boxes = cat_boxes_raw[:, :4]
-                    cat_ids = cat_boxes_raw[:, 4]
-                    category_names = [self.category_id2name(i) for i in cat_ids]
+            scene_cat_ann = self.category_annotations[scene]
+            if img_name in scene_cat_ann:
+                idx = scene_cat_ann.name2idx[img_name]
+                start, end = scene_cat_ann.box_offsets[idx], scene_cat_ann.box_offsets[idx + 1]
+                if end > start:
+                    cat_boxes = scene_cat_ann.boxes[start:end]
+                    cat_ids = scene_cat_ann.category_ids[start:end]
+                    category_names = self.category_name_table[cat_ids].tolist()
 
             output_dict.update({'category_boxes': cat_boxes, 'category_ids': cat_ids,
                                 'category_names': category_names})
 
         return output_dict
 
+    def link_instance_to_category(self, scenes=None, min_iou=0.5):
+        """ Link every instance box to its best overlapping category box of the same image.
+
+            All pairs of instance and category boxes of the same image are enumerated at once per
+        scene and the category box with the highest IoU is kept for each instance box.
+
+        Parameters
+        ----------
+        scenes: list or None, default=None
+            Scenes to link. All loaded scenes when None.
+        min_iou: float, default=0.5
+            Minimum IoU of a link. Instance boxes without such a category box are not linked.
+
+        Returns
+        -------
+        dict
+            Scene: dict of arrays aligned with the instance boxes of the scene (see
+            *get_image_boxes_raw*): 'category_box' int64 row in the scene's category boxes,
+            'category_id' int32 and 'iou' float32. Unlinked boxes have -1 rows and ids and 0 IoU.
+        """
+        if scenes is None:
+            scenes = self.loaded_scenes
+
+        links = dict()
+        for scene in scenes:
+            assert scene in self.loaded_scenes, f'Specified scene is not loaded: {scene}'
+            scene_ann = self.annotations[scene]
+            scene_cat_ann = self.category_annotations[scene]
+
+            # Category box segment of each instance image, empty if the image has no category file
+            cat_idx = np.array([scene_cat_ann.name2idx.get(i, -1)
+                                for i in scene_ann.image_names.tolist()], dtype=np.int64)
+            has_cat = cat_idx >= 0
+            cat_starts = np.where(has_cat, scene_cat_ann.box_offsets[cat_idx], 0)
+            cat_counts = np.where(has_cat, scene_cat_ann.box_offsets[cat_idx + 1] - cat_starts, 0)
+
+            inst_rows, cat_rows = segment_pairs(scene_ann.box_offsets, cat_starts, cat_counts)
+            ious = paired_iou(scene_ann.boxes[inst_rows, :4], scene_cat_ann.boxes[cat_rows])
+            keep = ious >= min_iou
+            inst_rows, cat_rows, ious = inst_rows[keep], cat_rows[keep], ious[keep]
+
+            # Best category box of each instance box is the first after sorting by decreasing IoU
+            order = np.lexsort((-ious, inst_rows))
+            inst_rows, cat_rows, ious = inst_rows[order], cat_rows[order], ious[order]
+            first = np.ones(len(inst_rows), dtype=bool)
+            first[1:] = inst_rows[1:] != inst_rows[:-1]
+
+            num_boxes = len(scene_ann.boxes)
+            scene_links = {'category_box': np.full(num_boxes, -1, dtype=np.int64),
+                           'category_id': np.full(num_boxes, -1, dtype=np.int32),
+                           'iou': np.zeros(num_boxes, dtype=np.float32)}
+            scene_links['category_box'][inst_rows[first]] = cat_rows[first]
+            scene_links['category_id'][inst_rows[first]] = scene_cat_ann.category_ids[
+                cat_rows[first]]
+            scene_links['iou'][inst_rows[first]] = ious[first]
+            links[scene] = scene_links
+
+        return links
+
+
+def img_name2depth_name(img_name):
+    """ Get name of the depth image of an rgb image.
+
+        For example, 000110000010101.jpg -> 000110000010103.png
+    """
+    return img_name.split('.')[0][:-1] + '3.png'
+
+
+def get_boxes_and_labels(annotations, scene, img_name, box_type='instance'):
+    """ Get boxes of an image to display along with their instance or category names as labels.
+
+        `annotations` must be *AVDCategoryAnns* for 'category' and 'both' box types.
+    """
+    if box_type == 'instance':
+        boxes_dict = annotations.get_image_boxes(scene, img_name)
+    else:
+        boxes_dict = annotations.get_image_boxes(scene, img_name, box_type=box_type)
+
+    bboxes = []
+    labels = []
+
+    if box_type == 'instance' or box_type == 'both':
+        bboxes += list(boxes_dict['instance_boxes'])
+        labels += boxes_dict['instance_names']
+    if box_type == 'category' or box_type == 'both':
+        bboxes += list(boxes_dict['category_boxes'])
+        labels += boxes_dict['category_names']
+
+    return bboxes, labels
+
+
+def id2name_table(id2name_map):
+    """ Create array for vectorized lookup of names from integer ids.
+
+    Parameters
+    ----------
+    id2name_map: dict
+        Mapping from non-negative integer id to name.
+
+    Returns
+    -------
+    numpy array
+        Object array such that table[id] is the name of id and None for unknown ids.
+    """
+    table = np.full(max(id2name_map, default=-1) + 1, None, dtype=object)
+    for id_, name in id2name_map.items():
+        table[id_] = name
+    return table
+
+
+def _load_scene_annotations(scene, data_root, use_cache=False, cache_root=None):
+    if use_cache:
+        return load_scene_cache(data_root, scene, cache_root=cache_root)
+
+    ann_file_path = os.path.join(data_root, scene, SCENE_ANNOTATIONS_FNAME)
+    with open(ann_file_path, 'r') as f:
+        annotations = json.load(f)
+    return SceneAnnotations.from_json(annotations, scene=scene)
+
+
+def _load_scene_category_boxes(scene_images, data_root, cache_root=None):
+    """ Load category boxes of a scene from its pack or from the annotation file of each image.
+
+    Parameters
+    ----------
+    scene_images: tuple
+        Name of the scene and list of names of its images.
+    data_root: str
+        Root of the Active Vision Dataset.
+    cache_root: str or None, default=None
+        Root folder for compiled caches.
+
+    Returns
+    -------
+    scene_cat_ann: SceneCategoryBoxes
+        Packed category boxes of the scene.
+    category_id2name_map: dict
+        Mapping from category id to name of all categories in the scene.
+    """
+    scene, img_names = scene_images
+    scene_cat_ann = load_category_pack(data_root, scene, cache_root=cache_root)
+    if scene_cat_ann is not None:
+        return scene_cat_ann, scene_cat_ann.category_id2name_map
+
+    found_names = []
+    found_boxes = []
+    category_id2name_map = dict()
+    for img_name in img_names:
+        mat_name = img_name.split('.')[0] + '.mat'
+        ann_path = os.path.join(data_root, CATEGORY_FOLDER, scene, CATEGORY_BOXES_FOLDER, mat_name)
+
+        if os.path.isfile(ann_path):
+            img_ann, category_names = read_category_mat(ann_path)
+            found_names.append(img_name)
+            found_boxes.append(img_ann)
+
+            # TODO: Add separate file for category label mapping
+            # Check integrity of object id to name
+            for box, obj_cat in zip(img_ann, category_names):
+                assert category_id2name_map.setdefault(box[4], obj_cat) == obj_cat, \
+                    f'Category id to name mismatch for {img_name}!'
+
+    scene_cat_ann = SceneCategoryBoxes.from_lists(found_names, found_boxes, category_id2name_map)
+    return scene_cat_ann, category_id2name_map
+
 
 if __name__ == '__main__':
     from activevision.defaults import AVD_DATASET
@@ -1,7 +1,9 @@
 import os
+from functools import partial
 import numpy as np
 import pandas as pd
-from activevision.utils.matlab_utils import load_image_struct
+from activevision.utils.matlab_utils import load_image_struct, image_struct_to_arrays
+from activevision.utils.parallel_utils import parallel_map
 from activevision.defaults import IMG_STRUCT_FNAME, ALL_SCENES
 
 
@@ -9,34 +11,50 @@ class AVDParamsLoader:
     def __init__(self, data_root):
         self.data_root = data_root
         self.params = None
+        self.arrays = None
         self.available_scenes = []
 
-    @staticmethod
-    def col_convert_function(col_name):
-        """Return function for data conversion of column in image_struct df.
+    def extract_arrays(self, scenes=None, workers=None):
+        """ Extract data of specified scenes into typed contiguous arrays.
+
+            Arrays of all scenes are concatenated once and appended to the previously extracted
+        arrays in `arrays`. See *image_struct_to_arrays* for the extracted arrays. Additionally,
+        'scene' (N,) and 'scale' (N,) arrays hold the scene and scale of each image.
 
         Parameters
         ----------
-        col_name: str
-            Name of the column in image_struct.mat
+        scenes: list or None, default None
+            List of scenes for which data is to be extracted. If None, uses all scenes specified in
+            defaults.
+        workers: int or None, default None
+            Number of processes to extract scenes concurrently. Results are concatenated in the
+            order of `scenes`. Scenes are extracted sequentially when None.
 
         Returns
         -------
-        Respective function or identity function if not defined specifically.
+        dict
+            Arrays of the specified scenes.
         """
-        if col_name == 'image_id' or col_name == 'camera_id':
-            return lambda el: int(el[0]) if len(el) > 0 else -1
-        elif col_name == 'image_name' or col_name.startswith(('rotate', 'translate')):
-            # default type is np.str_
-            return lambda el: np.NaN if type(el[0]) == np.ndarray else el[0]
-        elif col_name in ('t', 'R'):
-            return lambda el: el if el.size > 0 else np.NaN
-        elif col_name == 'cluster_id':
-            return lambda el: el[0][0]
-        # Return identity function
-        return lambda x: x
-
-    def extract_mat_files(self, scenes=None):
+        # Load all scenes by default
+        if scenes is None or (type(scenes) == list and len(scenes) == 0):
+            scenes = ALL_SCENES
+
+        # Check all scenes are valid and stored in default available scenes list
+        for scene in scenes:
+            assert scene in ALL_SCENES, f'Specified scene not available in default scenes: {scene}'
+            assert scene not in self.available_scenes, f'Scene already extracted: {scene}'
+
+        # Load parameters for each scene and concatenate once
+        scene_arrays = parallel_map(partial(_extract_scene_arrays, data_root=self.data_root),
+                                    scenes, workers=workers, executor='process')
+        arrays = concatenate_arrays(scene_arrays)
+
+        self.arrays = arrays if self.arrays is None else concatenate_arrays([self.arrays, arrays])
+        self.available_scenes.extend(scenes)
+
+        return arrays
+
+    def extract_mat_files(self, scenes=None, workers=None, as_dataframe=True):
         """ Extract data appropriately for specified scenes in dataframe format.
 
         Parameters
@@ -44,37 +62,77 @@ class AVDParamsLoader:
         scenes: list or None, default None
             List of scenes for which data is to be extracted. If None, uses all scenes specified in
             defaults.
+        workers: int or None, default None
+            Number of processes to extract scenes concurrently. Results are concatenated in the
+            order of `scenes`. Scenes are extracted sequentially when None.
+        as_dataframe: bool, default True
+            Flag to also build the `params` dataframe from the extracted `arrays`.
 
         Returns
         -------
         None
         """
-        # Load all scenes by default
-        if scenes is None or (type(scenes) == list and len(scenes) == 0):
-            scenes = ALL_SCENES
+        self.extract_arrays(scenes=scenes, workers=workers)
 
-        # Check all scenes are valid and stored in default available scenes list
-        for scene in scenes:
-            assert scene in ALL_SCENES, f'Specified scene not available in default scenes: {scene}'
+        if as_dataframe:
+            self.params = arrays_to_dataframe(self.arrays)
 
-        # Load parameters for each scene and concatenate
-        for scene in scenes:
-            path = os.path.join(self.data_root, scene, IMG_STRUCT_FNAME)
-            image_structs, scale = load_image_struct(path)
-            scale = int(scale)  # default is uint
-            columns = image_structs.dtype.names
-            dataframe = pd.DataFrame(data=image_structs, columns=columns)
 
-            for col in columns:
-                dataframe[col] = dataframe[col].apply(func=self.col_convert_function(col))
+def concatenate_arrays(arrays_list):
+    """ Concatenate dicts of arrays with same keys along the first axis. """
+    return {k: np.concatenate([i[k] for i in arrays_list]) for k in arrays_list[0]}
+
+
+def arrays_to_dataframe(arrays):
+    """ Build image struct dataframe indexed by image name from extracted arrays.
+
+        Columns hold one value per image:
+        - 't', 'R': array of shape (3,1) and (3,3), NaN when the pose is missing
+        - 'world_pos', 'direction', 'quat', 'scaled_world_pos': array of shape (n,1), NaN filled
+          when missing
+        - 'image_id', 'camera_id', 'cluster_id': int, -1 when missing
+        - neighbor image names such as 'rotate_cw': str, NaN when there is no neighbor
+        - 'scale': int scale of the scene
+    Vector and neighbor columns are only present if their field is in the image struct.
+
+    Parameters
+    ----------
+    arrays: dict
+        Arrays as returned by *AVDParamsLoader.extract_arrays*.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    columns = dict()
+    for col, values in arrays.items():
+        if col in ('image_name', 'pose_valid', 'scene'):
+            continue
+        elif col in ('t', 'R'):
+            rows = values[:, :, None] if col == 't' else values
+            missing = np.isnan(values.reshape(len(values), -1)).any(axis=1)
+            columns[col] = [np.nan if m else row for row, m in zip(rows, missing)]
+        elif values.dtype.kind == 'f':
+            columns[col] = list(values[:, :, None])
+        elif values.dtype.kind == 'U':
+            columns[col] = np.where(values == '', np.nan, values.astype(object))
+        else:
+            columns[col] = values
+
+    dataframe = pd.DataFrame(columns, index=pd.Index(arrays['image_name'], name='image_name'))
+    assert dataframe.index.is_unique, 'Image names are not unique across scenes.'
+
+    return dataframe
 
-            dataframe['scale'] = scale
-            dataframe.set_index('image_name', inplace=True)
 
-            if self.params is None:
-                self.params = dataframe
-            else:
-                self.params = self.params.append(dataframe, verify_integrity=True)
+def _extract_scene_arrays(scene, data_root):
+    path = os.path.join(data_root, scene, IMG_STRUCT_FNAME)
+    image_structs, scale = load_image_struct(path)
+    scale = int(scale)  # default is uint
 
-            self.available_scenes.append(scene)
+    arrays = image_struct_to_arrays(image_structs)
+    num_images = len(arrays['image_name'])
+    arrays['scene'] = np.full(num_images, scene)
+    arrays['scale'] = np.full(num_images, scale, dtype=np.int64)
 
+    return arrays
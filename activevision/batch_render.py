@@ -0,0 +1,240 @@
+import os
+import json
+import hashlib
+from functools import partial
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+
+from activevision.annotations import AVDAnnotations, AVDCategoryAnns, get_boxes_and_labels
+from activevision.frame_reader import decode_frame
+from activevision.utils.parallel_utils import parallel_map
+from activevision.utils.plot_utils import bboxplot_in_img
+
+RENDER_MANIFEST_FNAME = 'manifest.json'
+CONTACT_SHEET_FNAME = 'contact_sheet.jpg'
+
+
+def frame_signature(stat, bboxes, labels, params):
+    """ Hash everything a rendered frame depends on: image file, boxes, labels and parameters.
+
+        `stat` is the *os.stat_result* of the image file, e.g. from *os.scandir*.
+    """
+    digest = hashlib.sha1()
+    digest.update(f'{stat.st_mtime_ns} {stat.st_size} {json.dumps(params, sort_keys=True)}'
+                  .encode())
+    digest.update(np.ascontiguousarray(np.asarray(bboxes, dtype=np.float64)).tobytes())
+    digest.update('\n'.join(str(i) for i in labels).encode())
+    return digest.hexdigest()
+
+
+def render_frame(task, scale=1.0, dpi=100, fast=True):
+    """ Render an image with its boxes to a file at the resolution of the image times `scale`.
+
+    Parameters
+    ----------
+    task: tuple
+        Path of the image, path of the output file, (num_boxes, 4) boxes and their labels.
+    scale: float, default=1.0
+        Scale of the output. Frames are decoded at reduced resolution when less than 1.
+    dpi: int, default=100
+        Resolution of the matplotlib figure. Only affects the relative size of lines and text.
+    fast: bool, default=True
+        Flag to draw boxes as a single collection. See *bboxplot_in_img*.
+
+    Returns
+    -------
+    str
+        Path of the output file.
+    """
+    img_path, out_path, bboxes, labels = task
+    img, (width, height) = decode_frame(img_path, scale=scale, return_source_size=True)
+    size = (img.shape[1], img.shape[0])
+    bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4) * [size[0] / width, size[1] / height,
+                                                               size[0] / width, size[1] / height]
+
+    # Figure with its own Agg canvas instead of pyplot, so the backend of the process is unchanged
+    fig = Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes((0, 0, 1, 1))
+    ax.set_axis_off()
+    bboxplot_in_img(img, bboxes=bboxes, labels=list(labels), fig=fig, ax=ax, return_fig=True,
+                    fast=fast)
+    fig.savefig(out_path, dpi=dpi)
+    return out_path
+
+
+def make_contact_sheet(frame_paths, out_path, columns=8, thumb_width=320):
+    """ Tile rendered frames into a single mosaic image in row major order.
+
+    Parameters
+    ----------
+    frame_paths: list
+        Paths of the rendered frames.
+    out_path: str
+        Path of the mosaic.
+    columns: int, default=8
+        Number of frames per row.
+    thumb_width: int, default=320
+        Width of each tile. Tiles keep the aspect ratio of the first frame.
+
+    Returns
+    -------
+    str
+        Path of the mosaic.
+    """
+    assert len(frame_paths) > 0, 'No frames for the contact sheet.'
+    with Image.open(frame_paths[0]) as first:
+        thumb_size = (thumb_width, max(int(round(thumb_width * first.height / first.width)), 1))
+    rows = (len(frame_paths) + columns - 1) // columns
+
+    sheet = Image.new('RGB', (columns * thumb_size[0], rows * thumb_size[1]), color='white')
+    for idx, path in enumerate(frame_paths):
+        with Image.open(path) as frame:
+            frame.draft('RGB', thumb_size)
+            thumb = frame.convert('RGB').resize(thumb_size, resample=Image.BILINEAR)
+        row, col = divmod(idx, columns)
+        sheet.paste(thumb, (col * thumb_size[0], row * thumb_size[1]))
+    sheet.save(out_path, quality=90)
+    return out_path
+
+
+def render_scene(annotations, scene, output_dir, box_type='both', workers=None, scale=1.0,
+                 contact_sheet=False, columns=8, force=False):
+    """ Render every frame of a loaded scene with its boxes.
+
+        Frames are written to `output_dir`/`scene`/<image name>. A manifest stores a signature of
+    each frame's image file, boxes, labels and render parameters so that re-runs only render
+    frames whose signature changed or whose output is missing.
+
+    Parameters
+    ----------
+    annotations: AVDAnnotations or AVDCategoryAnns
+        Annotations with the scene loaded. Must be *AVDCategoryAnns* for category boxes.
+    scene: str
+        Name of the scene.
+    output_dir: str
+        Root folder of the rendered frames.
+    box_type: ('instance', 'category', 'both'), default='both'
+        Type of boxes to render.
+    workers: int or None, default=None
+        Number of rendering processes.
+    scale: float, default=1.0
+        Scale of the rendered frames relative to the images.
+    contact_sheet: bool, default=False
+        Flag to also tile all frames of the scene into one mosaic. See *make_contact_sheet*.
+    columns: int, default=8
+        Number of frames per row of the contact sheet.
+    force: bool, default=False
+        Flag to render all frames even if unchanged.
+
+    Returns
+    -------
+    list
+        Names of the rendered images.
+    """
+    scene_dir = os.path.join(output_dir, scene)
+    os.makedirs(scene_dir, exist_ok=True)
+    manifest_path = os.path.join(scene_dir, RENDER_MANIFEST_FNAME)
+    manifest = dict()
+    if os.path.isfile(manifest_path) and not force:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+    params = {'box_type': box_type, 'scale': scale}
+    names = annotations.annotations[scene].image_names.tolist()
+    signatures = dict()
+    tasks = []
+    img_stats = dict()  # Image folder: name to stat of its files, listed once
+    for name in names:
+        img_path = annotations.img_name2path(scene=scene, name=name)
+        img_dir = os.path.dirname(img_path)
+        if img_dir not in img_stats:
+            with os.scandir(img_dir) as entries:
+                img_stats[img_dir] = {i.name: i.stat() for i in entries}
+        out_path = os.path.join(scene_dir, name)
+        bboxes, labels = get_boxes_and_labels(annotations, scene, name, box_type=box_type)
+        bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+        signatures[name] = frame_signature(img_stats[img_dir][os.path.basename(img_path)],
+                                           bboxes, labels, params)
+        if manifest.get(name) != signatures[name] or not os.path.isfile(out_path):
+            tasks.append((img_path, out_path, bboxes, labels))
+
+    parallel_map(partial(render_frame, scale=scale), tasks, workers=workers, executor='process')
+
+    # Only record frames once they are written
+    with open(manifest_path, 'w') as f:
+        json.dump(signatures, f)
+
+    sheet_path = os.path.join(scene_dir, CONTACT_SHEET_FNAME)
+    if contact_sheet and len(names) > 0 and (len(tasks) > 0 or not os.path.isfile(sheet_path)):
+        make_contact_sheet([os.path.join(scene_dir, i) for i in names], sheet_path,
+                           columns=columns)
+
+    return [os.path.basename(i[1]) for i in tasks]
+
+
+def render_scenes(data_root, scenes, output_dir, box_type='both', workers=None, scale=1.0,
+                  contact_sheet=False, columns=8, force=False, use_cache=False, cache_root=None):
+    """ Load and render scenes one after another. See *render_scene* for the other parameters.
+
+    Parameters
+    ----------
+    use_cache: bool, default=False
+        Flag to load annotations from compiled caches, compiling them on first use. Nothing is
+        written to the dataset when False, e.g. for read-only datasets.
+    cache_root: str or None, default=None
+        Root folder for compiled caches. Uses a folder inside `data_root` when None.
+
+    Returns
+    -------
+    dict
+        Scene: names of the rendered images.
+    """
+    ann_class = AVDAnnotations if box_type == 'instance' else AVDCategoryAnns
+    annotations = ann_class(data_root=data_root, use_cache=use_cache, cache_root=cache_root)
+    annotations.load_annotations(scenes=scenes, workers=workers)
+
+    return {scene: render_scene(annotations, scene, output_dir, box_type=box_type,
+                                workers=workers, scale=scale, contact_sheet=contact_sheet,
+                                columns=columns, force=force)
+            for scene in scenes}
+
+
+if __name__ == '__main__':
+    import argparse
+    from activevision.defaults import AVD_DATASET
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenes', '-s', type=str, nargs='+', required=True,
+                        help='Scenes to render.')
+    parser.add_argument('--output', '-o', type=str, required=True,
+                        help='Output directory.')
+    parser.add_argument('--type', type=str, default='both',
+                        choices=['instance', 'category', 'both'],
+                        help='Type of bounding boxes to render.')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help='Number of processes.')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Scale of the rendered frames, e.g. 0.5 for half resolution.')
+    parser.add_argument('--contact-sheet', action='store_true',
+                        help='Also write one mosaic of all frames per scene.')
+    parser.add_argument('--columns', type=int, default=8,
+                        help='Number of frames per row of the contact sheet.')
+    parser.add_argument('--force', action='store_true',
+                        help='Render all frames even if unchanged.')
+    parser.add_argument('--use-cache', action='store_true',
+                        help='Load annotations from compiled caches, compiling them if needed.')
+    parser.add_argument('--cache-root', type=str, default=None,
+                        help='Root folder for caches. Defaults to a folder inside the dataset.')
+
+    args = parser.parse_args()
+
+    rendered = render_scenes(AVD_DATASET, args.scenes, args.output, box_type=args.type,
+                             workers=args.workers, scale=args.scale,
+                             contact_sheet=args.contact_sheet, columns=args.columns,
+                             force=args.force, use_cache=args.use_cache,
+                             cache_root=args.cache_root)
+    for s, frames in rendered.items():
+        print(f'{s}: rendered {len(frames)} frames')
@@ -0,0 +1,366 @@
+import os
+from functools import partial
+import numpy as np
+from PIL import Image
+from scipy.optimize import linear_sum_assignment
+
+from activevision.annotations import img_name2depth_name
+from activevision.camera_param_utils import get_intrinsics_registry, camera_params_path
+from activevision.coordinate_utils import bbox_pixel_indices_batch, get_ray_grid
+from activevision.depth_stack import load_depth_stack
+from activevision.pose_store import load_pose_store
+from activevision.projection import intrinsics_to_arrays
+from activevision.tR_utils import relative_tR_pairs
+from activevision.utils.box_ops import pairwise_iou
+from activevision.utils.cache_utils import get_cache_dir, is_cache_valid, read_cache_meta
+from activevision.utils.cache_utils import save_arrays, load_arrays, directory_sources
+from activevision.utils.parallel_utils import parallel_map
+from activevision.defaults import SCENE_ANNOTATIONS_FNAME, IMG_STRUCT_FNAME, DEPTH_FOLDER
+
+BOX_MATCHES_NAME = 'box_matches'
+BOX_MATCHES_VERSION = 1
+
+
+def project_boxes(bounding_boxes, depth, tc2c1, Rc2c1, K1, K2, target_size=None, min_points=10):
+    """ Project boxes of a source view into a target view using the source depth.
+
+        Depth filtered pixels of every box (see *bbox_pixel_indices_roi*) are back-projected,
+    transformed to the target camera and projected to target pixels in a single pass over the
+    concatenated pixels of all boxes. The projected box is the extent of the projected pixels that
+    land in front of the target camera and inside the target image.
+
+    Parameters
+    ----------
+    bounding_boxes: numpy array
+        Source boxes of shape (N,4) in [x1, y1, x2, y2] format.
+    depth: PIL Image or numpy array
+        Source depth image of shape (height, width).
+    tc2c1: numpy array
+        Camera-1 to Camera-2 translation of shape (3,1) in depth units. See *relative_tR_pairs*.
+    Rc2c1: numpy array
+        Camera-1 to Camera-2 rotation of shape (3,3).
+    K1: dict or numpy array
+        Intrinsics of the source view. See *intrinsics_to_arrays*.
+    K2: dict or numpy array
+        Intrinsics of the target view.
+    target_size: tuple or None, default=None
+        (width, height) of the target image. Same as the source when None.
+    min_points: int, default=10
+        Minimum number of projected pixels inside the target image for a box to be projected.
+
+    Returns
+    -------
+    projected: numpy array
+        Float64 boxes of shape (N,4) in the target view. Boxes with fewer than `min_points` visible
+        pixels are NaN.
+    num_visible: numpy array
+        Int64 array of shape (N,) with number of visible projected pixels of each box.
+    """
+    depth = np.asarray(depth)
+    imh, imw = depth.shape
+    target_w, target_h = (imw, imh) if target_size is None else target_size
+    num_boxes = len(bounding_boxes)
+
+    fx1, fy1, cx1, cy1 = [i[0] for i in intrinsics_to_arrays(K1, 1)]
+    fx2, fy2, cx2, cy2 = [i[0] for i in intrinsics_to_arrays(K2, 1)]
+    rays = get_ray_grid(imw, imh, fx=fx1, fy=fy1, cx=cx1, cy=cy1).rays
+
+    box_indices = bbox_pixel_indices_batch(np.asarray(bounding_boxes)[:, :4], depth,
+                                           filter_depth=True)
+    indices = np.concatenate(box_indices + [np.empty(0, dtype=np.int64)])
+    box_ids = np.repeat(np.arange(num_boxes), [len(i) for i in box_indices])
+
+    cam2 = Rc2c1 @ (rays[:, indices] * depth.reshape(-1)[indices]) + np.reshape(tc2c1, (3, 1))
+    z2 = cam2[2]
+    valid = z2 > 0
+    u = np.divide(cam2[0], z2, out=np.zeros_like(z2), where=valid) * fx2 + cx2
+    v = np.divide(cam2[1], z2, out=np.zeros_like(z2), where=valid) * fy2 + cy2
+    valid &= (u >= 0) & (u <= target_w - 1) & (v >= 0) & (v <= target_h - 1)
+    u, v, box_ids = u[valid], v[valid], box_ids[valid]
+
+    num_visible = np.bincount(box_ids, minlength=num_boxes)
+    projected = np.empty((num_boxes, 4), dtype=np.float64)
+    projected[:, :2] = np.inf
+    projected[:, 2:] = -np.inf
+    np.minimum.at(projected[:, 0], box_ids, u)
+    np.minimum.at(projected[:, 1], box_ids, v)
+    np.maximum.at(projected[:, 2], box_ids, u)
+    np.maximum.at(projected[:, 3], box_ids, v)
+    projected[num_visible < max(min_points, 1)] = np.nan
+
+    return projected, num_visible
+
+
+def match_boxes(projected, target_boxes, iou_threshold=0.5):
+    """ Match projected source boxes one to one with target boxes by maximum total IoU.
+
+    Parameters
+    ----------
+    projected: numpy array
+        Projected source boxes of shape (N,4). Boxes with NaN coordinates are never matched.
+    target_boxes: numpy array
+        Target boxes of shape (M,4).
+    iou_threshold: float, default=0.5
+        Minimum IoU of a matched pair. Pairs that do not overlap are never matched, even with a
+        threshold of 0.
+
+    Returns
+    -------
+    src_idx: numpy array
+        Int64 rows of matched source boxes.
+    tgt_idx: numpy array
+        Int64 rows of matched target boxes.
+    ious: numpy array
+        IoU of each matched pair.
+    """
+    projected = np.asarray(projected, dtype=np.float64).reshape(-1, 4)
+    iou = pairwise_iou(projected, np.asarray(target_boxes)[:, :4])
+    # Non-finite boxes get IoU 0 with every target so they are removed with non-overlapping pairs
+    iou[~np.isfinite(projected).all(axis=1)] = 0
+    if iou.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float64)
+
+    src_idx, tgt_idx = linear_sum_assignment(iou, maximize=True)
+    matched_iou = iou[src_idx, tgt_idx]
+    keep = (matched_iou >= iou_threshold) & (matched_iou > 0)
+    src_idx, tgt_idx = src_idx[keep].astype(np.int64), tgt_idx[keep].astype(np.int64)
+    return src_idx, tgt_idx, iou[src_idx, tgt_idx]
+
+
+class BoxAssociator:
+    """ Associate instance boxes of a scene across views by projecting them with depth and poses.
+
+        Poses and intrinsics of a scene are loaded once and reused for every pair of views.
+    """
+
+    def __init__(self, scene_ann, scene, data_root, cache_root=None, iou_threshold=0.5,
+                 min_points=10, use_depth_stack=False):
+        """
+        Parameters
+        ----------
+        scene_ann: SceneAnnotations
+            Annotations of the scene.
+        scene: str
+            Name of the scene.
+        data_root: str
+            Root of the Active Vision Dataset.
+        cache_root: str or None, default=None
+            Root folder for compiled caches, used for the pose store.
+        iou_threshold: float, default=0.5
+            Minimum IoU of matched boxes.
+        min_points: int, default=10
+            Minimum number of visible projected pixels of a box. See *project_boxes*.
+        use_depth_stack: bool, default=False
+            Flag to read depths from the memory mapped depth stack of the scene instead of
+            decoding png files. The stack is compiled on first use. See *load_depth_stack*.
+        """
+        self.scene_ann = scene_ann
+        self.scene = scene
+        self.data_root = data_root
+        self.iou_threshold = iou_threshold
+        self.min_points = min_points
+        self.poses = load_pose_store(data_root, scene, cache_root=cache_root)
+        self.intrinsics = get_intrinsics_registry(data_root).K(scene)
+        self.depth_stack = load_depth_stack(data_root, scene, cache_root=cache_root) \
+            if use_depth_stack else None
+
+    def _as_idx(self, image):
+        return self.scene_ann.name2idx[image] if isinstance(image, str) else int(image)
+
+    def load_depth(self, image):
+        """ Load the high resolution depth of an image given by name or index. """
+        name = str(self.scene_ann.image_names[self._as_idx(image)])
+        if self.depth_stack is not None:
+            return self.depth_stack[name]
+        depth_path = os.path.join(self.data_root, self.scene, DEPTH_FOLDER,
+                                  img_name2depth_name(name))
+        return np.array(Image.open(depth_path))
+
+    def has_pose(self, image):
+        name = str(self.scene_ann.image_names[self._as_idx(image)])
+        return name in self.poses and bool(self.poses.pose_valid[self.poses.rows(name)])
+
+    def associate_many(self, source, targets, depth=None):
+        """ Associate boxes of a source view with boxes of several target views.
+
+        Parameters
+        ----------
+        source: str or int
+            Name or index of the source image.
+        targets: list
+            Names or indices of the target images.
+        depth: numpy array or None, default=None
+            Depth of the source image. Loaded from disk when None.
+
+        Returns
+        -------
+        list
+            For each target a dict with 'src_box' and 'tgt_box' rows of matched boxes in the
+            scene's box array, their 'iou' and 'projected' (N,4) source boxes in the target view.
+            Targets without boxes or pose match nothing.
+        """
+        src_idx = self._as_idx(source)
+        tgt_indices = [self._as_idx(i) for i in targets]
+        offsets = self.scene_ann.box_offsets
+        src_start, src_end = offsets[src_idx], offsets[src_idx + 1]
+        src_boxes = self.scene_ann.boxes[src_start:src_end, :4]
+
+        empty = {'src_box': np.empty(0, dtype=np.int64), 'tgt_box': np.empty(0, dtype=np.int64),
+                 'iou': np.empty(0, dtype=np.float64),
+                 'projected': np.full((len(src_boxes), 4), np.nan)}
+        if len(src_boxes) == 0 or not self.has_pose(src_idx):
+            return [dict(empty) for _ in tgt_indices]
+        if depth is None:
+            depth = self.load_depth(src_idx)
+
+        results = []
+        for tgt_idx in tgt_indices:
+            tgt_start, tgt_end = offsets[tgt_idx], offsets[tgt_idx + 1]
+            if tgt_end == tgt_start or not self.has_pose(tgt_idx):
+                results.append(dict(empty))
+                continue
+
+            rows = self.poses.rows([str(self.scene_ann.image_names[i]) for i in
+                                    (src_idx, tgt_idx)])
+            tc2c1, Rc2c1 = relative_tR_pairs(self.poses.t, self.poses.R, rows[:1], rows[1:],
+                                             scale=self.poses.scale)
+            projected, _ = project_boxes(src_boxes, depth, tc2c1[0], Rc2c1[0], self.intrinsics,
+                                         self.intrinsics, min_points=self.min_points)
+            src_rows, tgt_rows, ious = match_boxes(
+                projected, self.scene_ann.boxes[tgt_start:tgt_end, :4],
+                iou_threshold=self.iou_threshold)
+            results.append({'src_box': src_rows + src_start, 'tgt_box': tgt_rows + tgt_start,
+                            'iou': ious, 'projected': projected})
+
+        return results
+
+    def associate(self, source, target, depth=None):
+        """ Associate boxes of a source view with boxes of a target view. See *associate_many*. """
+        return self.associate_many(source, [target], depth=depth)[0]
+
+
+def neighbor_edges(scene_ann):
+    """ Get (source, target) image indices of every neighbor edge of a scene, sorted by source. """
+    src, direction = np.nonzero(scene_ann.neighbors >= 0)
+    return np.stack((src, scene_ann.neighbors[src, direction]), axis=1).astype(np.int64)
+
+
+def _associate_sources(scene_ann_and_sources, scene, data_root, cache_root=None,
+                       iou_threshold=0.5, min_points=10, use_depth_stack=False):
+    scene_ann, sources = scene_ann_and_sources
+    associator = BoxAssociator(scene_ann, scene, data_root, cache_root=cache_root,
+                               iou_threshold=iou_threshold, min_points=min_points,
+                               use_depth_stack=use_depth_stack)
+    edges = neighbor_edges(scene_ann)
+    # Edges are sorted by source, so the targets of each source are one contiguous slice
+    edge_offsets = np.searchsorted(edges[:, 0], np.arange(len(scene_ann.neighbors) + 1))
+
+    matches = {'src_image': [], 'tgt_image': [], 'src_box': [], 'tgt_box': [], 'iou': []}
+    for src_idx in sources:
+        targets = edges[edge_offsets[src_idx]:edge_offsets[src_idx + 1], 1]
+        for tgt_idx, result in zip(targets, associator.associate_many(src_idx, targets)):
+            num_matches = len(result['iou'])
+            matches['src_image'].append(np.full(num_matches, src_idx, dtype=np.int32))
+            matches['tgt_image'].append(np.full(num_matches, tgt_idx, dtype=np.int32))
+            matches['src_box'].append(result['src_box'])
+            matches['tgt_box'].append(result['tgt_box'])
+            matches['iou'].append(result['iou'].astype(np.float32))
+
+    return matches
+
+
+def _box_matches_sources(data_root, scene):
+    # Every depth image is signed as edits in place do not change the folder
+    return [os.path.join(data_root, scene, SCENE_ANNOTATIONS_FNAME),
+            os.path.join(data_root, scene, IMG_STRUCT_FNAME),
+            camera_params_path(data_root, scene)] + \
+        directory_sources(os.path.join(data_root, scene, DEPTH_FOLDER), '.png')
+
+
+def associate_scene(annotations, scene, workers=None, iou_threshold=0.5, min_points=10,
+                    force=False, use_depth_stack=False):
+    """ Associate boxes over every neighbor edge of a scene and store the matches.
+
+        Source images are split into chunks processed by a pool of processes, each source depth
+    being loaded once for all its neighbors. Matches are stored as arrays under the scene's cache
+    and reused until the annotations, image structs, camera parameters or depth images change.
+
+    Parameters
+    ----------
+    annotations: AVDAnnotations
+        Annotations with the scene loaded. Its `cache_root` is used for storing the matches.
+    scene: str
+        Name of the scene.
+    workers: int or None, default=None
+        Number of processes.
+    iou_threshold: float, default=0.5
+        Minimum IoU of matched boxes.
+    min_points: int, default=10
+        Minimum number of visible projected pixels of a box.
+    force: bool, default=False
+        Flag to recompute up to date matches.
+    use_depth_stack: bool, default=False
+        Flag to read depths from the memory mapped depth stack of the scene. See *BoxAssociator*.
+
+    Returns
+    -------
+    dict
+        Arrays of shape (num_matches,): 'src_image' and 'tgt_image' indices of the edge, 'src_box'
+        and 'tgt_box' rows in the scene's box array and 'iou' of the match.
+    """
+    data_root, cache_root = annotations.data_root, annotations.cache_root
+    cache_dir = get_cache_dir(data_root, scene, BOX_MATCHES_NAME, cache_root=cache_root)
+    sources = _box_matches_sources(data_root, scene)
+    params = {'iou_threshold': iou_threshold, 'min_points': min_points}
+
+    if not force and is_cache_valid(cache_dir, sources=sources, version=BOX_MATCHES_VERSION):
+        if read_cache_meta(cache_dir).get('params') == params:
+            return load_arrays(cache_dir)
+
+    if use_depth_stack:
+        # Compile once here instead of in every worker
+        load_depth_stack(data_root, scene, cache_root=cache_root, workers=workers)
+
+    scene_ann = annotations.annotations[scene]
+    src_images = np.unique(neighbor_edges(scene_ann)[:, 0])
+    num_chunks = 1 if workers is None or workers < 2 else workers * 4
+    chunks = [(scene_ann, i) for i in np.array_split(src_images, num_chunks) if len(i) > 0]
+
+    associate_fn = partial(_associate_sources, scene=scene, data_root=data_root,
+                           cache_root=cache_root, use_depth_stack=use_depth_stack, **params)
+    chunk_matches = parallel_map(associate_fn, chunks, workers=workers, executor='process')
+
+    dtypes = {'src_image': np.int32, 'tgt_image': np.int32, 'src_box': np.int64,
+              'tgt_box': np.int64, 'iou': np.float32}
+    matches = {k: np.concatenate([j for i in chunk_matches for j in i[k]] +
+                                 [np.empty(0, dtype=dtype)]).astype(dtype)
+               for k, dtype in dtypes.items()}
+    save_arrays(cache_dir, matches, sources=sources, version=BOX_MATCHES_VERSION,
+                extra_meta={'params': params})
+    return matches
+
+
+if __name__ == '__main__':
+    import argparse
+    from activevision.annotations import AVDAnnotations
+    from activevision.defaults import AVD_DATASET, ALL_SCENES
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenes', '-s', type=str, nargs='*', default=ALL_SCENES,
+                        help='Scenes to associate. Associates all scenes by default.')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help='Number of processes.')
+    parser.add_argument('--iou', type=float, default=0.5,
+                        help='Minimum IoU of matched boxes.')
+    parser.add_argument('--force', action='store_true',
+                        help='Recompute up to date matches.')
+
+    args = parser.parse_args()
+
+    avd = AVDAnnotations(data_root=AVD_DATASET, use_cache=True)
+    avd.load_annotations(scenes=args.scenes)
+    for s in args.scenes:
+        scene_matches = associate_scene(avd, s, workers=args.workers, iou_threshold=args.iou,
+                                        force=args.force)
+        print(f'{s}: {len(scene_matches["iou"])} matches')
@@ -0,0 +1,228 @@
+import os
+from functools import partial
+import numpy as np
+from PIL import Image
+
+from activevision.annotations import img_name2depth_name
+from activevision.camera_param_utils import load_camera_params, camera_params_path
+from activevision.coordinate_utils import bbox_pixel_indices_batch, get_ray_grid
+from activevision.pose_store import load_pose_store
+from activevision.utils.cache_utils import get_cache_dir, is_cache_valid, load_arrays
+from activevision.utils.cache_utils import save_arrays, directory_sources
+from activevision.utils.parallel_utils import parallel_map
+from activevision.defaults import SCENE_ANNOTATIONS_FNAME, IMG_STRUCT_FNAME, DEPTH_FOLDER
+
+BOX_STATS_NAME = 'box_stats'
+BOX_STATS_VERSION = 1
+# Percentiles of the filtered box depth used as its robust range
+DEPTH_RANGE_PERCENTILES = (10, 90)
+
+
+def _box_stats_sources(data_root, scene):
+    # Every depth image is signed as edits in place do not change the folder
+    return [os.path.join(data_root, scene, SCENE_ANNOTATIONS_FNAME),
+            os.path.join(data_root, scene, IMG_STRUCT_FNAME),
+            camera_params_path(data_root, scene)] + \
+        directory_sources(os.path.join(data_root, scene, DEPTH_FOLDER), '.png')
+
+
+def compute_scene_box_stats(scene_ann, scene, data_root, cache_root=None):
+    """ Compute 3D statistics of every instance box of a scene.
+
+        Pixels of each box are selected from the high resolution depth map with the depth filter
+    of *bbox_pixel_indices_roi* and back-projected to the camera coordinate. Statistics of boxes
+    without valid pixels, without depth image or without pose are NaN.
+
+    Parameters
+    ----------
+    scene_ann: SceneAnnotations
+        Annotations of the scene.
+    scene: str
+        Name of the scene.
+    data_root: str
+        Root of the Active Vision Dataset.
+    cache_root: str or None, default=None
+        Root folder for compiled caches, used for the pose store.
+
+    Returns
+    -------
+    dict
+        Arrays aligned with the rows of `scene_ann.boxes`:
+        'num_pixels': (num_boxes,) int32 number of filtered pixels,
+        'median_depth', 'depth_lo', 'depth_hi': (num_boxes,) float32 median and robust range of the
+        filtered depth, 'camera_centroid', 'world_centroid': (num_boxes, 3) float32 mean of the
+        filtered points in camera and world coordinates. Also 'image_names' and 'box_offsets' of
+        the scene.
+    """
+    num_boxes = len(scene_ann.boxes)
+    stats = {'num_pixels': np.zeros(num_boxes, dtype=np.int32),
+             'median_depth': np.full(num_boxes, np.nan, dtype=np.float32),
+             'depth_lo': np.full(num_boxes, np.nan, dtype=np.float32),
+             'depth_hi': np.full(num_boxes, np.nan, dtype=np.float32),
+             'camera_centroid': np.full((num_boxes, 3), np.nan, dtype=np.float32),
+             'world_centroid': np.full((num_boxes, 3), np.nan, dtype=np.float32)}
+
+    poses = load_pose_store(data_root, scene, cache_root=cache_root)
+    intrinsics = load_camera_params(data_root, scene, return_default=True)
+
+    for idx, img_name in enumerate(scene_ann.image_names.tolist()):
+        start, end = scene_ann.box_offsets[idx], scene_ann.box_offsets[idx + 1]
+        depth_path = os.path.join(data_root, scene, DEPTH_FOLDER, img_name2depth_name(img_name))
+        if end == start or not os.path.isfile(depth_path):
+            continue
+
+        depth = np.array(Image.open(depth_path))
+        imh, imw = depth.shape
+        rays = get_ray_grid(imw, imh, fx=intrinsics['fx'], fy=intrinsics['fy'],
+                            cx=intrinsics['cx'], cy=intrinsics['cy']).rays
+        depth_flat = depth.reshape(-1)
+
+        has_pose = img_name in poses and poses.pose_valid[poses.rows(img_name)]
+        if has_pose:
+            tcw, Rcw = poses.get_tR(img_name, scaled=True)
+
+        box_indices = bbox_pixel_indices_batch(scene_ann.boxes[start:end, :4], depth,
+                                               filter_depth=True)
+        for row, indices in zip(range(start, end), box_indices):
+            if len(indices) == 0:
+                continue
+            z = depth_flat[indices].astype(np.float64)
+            camera_centroid = (rays[:, indices] * z).mean(axis=1)
+
+            stats['num_pixels'][row] = len(indices)
+            stats['median_depth'][row] = np.median(z)
+            stats['depth_lo'][row], stats['depth_hi'][row] = np.percentile(
+                z, DEPTH_RANGE_PERCENTILES)
+            stats['camera_centroid'][row] = camera_centroid
+            if has_pose:
+                # Xw = Rcw^T (Xc - tcw)
+                stats['world_centroid'][row] = Rcw.T @ (camera_centroid - tcw[:, 0])
+
+    stats['image_names'] = scene_ann.image_names
+    stats['box_offsets'] = scene_ann.box_offsets
+    return stats
+
+
+def _build_scene_box_stats(scene_and_ann, data_root, cache_root=None):
+    scene, scene_ann = scene_and_ann
+    stats = compute_scene_box_stats(scene_ann, scene, data_root, cache_root=cache_root)
+    save_arrays(get_cache_dir(data_root, scene, BOX_STATS_NAME, cache_root=cache_root), stats,
+                sources=_box_stats_sources(data_root, scene), version=BOX_STATS_VERSION)
+    return scene
+
+
+def build_box_stats(annotations, scenes=None, workers=None, force=False):
+    """ Precompute and store per box 3D statistics of loaded scenes.
+
+        Only scenes whose annotations, image structs, camera parameters or depth images changed
+    since their statistics were stored are recomputed, unless `force` is set.
+
+    Parameters
+    ----------
+    annotations: AVDAnnotations
+        Annotations with scenes loaded. Its `cache_root` is used for storing the statistics.
+    scenes: list or None, default=None
+        Scenes to compute. All loaded scenes when None.
+    workers: int or None, default=None
+        Number of processes computing scenes concurrently.
+    force: bool, default=False
+        Flag to recompute scenes with up to date statistics.
+
+    Returns
+    -------
+    list
+        Scenes that were recomputed.
+    """
+    data_root, cache_root = annotations.data_root, annotations.cache_root
+    if scenes is None:
+        scenes = annotations.loaded_scenes
+
+    stale_scenes = []
+    for scene in scenes:
+        cache_dir = get_cache_dir(data_root, scene, BOX_STATS_NAME, cache_root=cache_root)
+        if force or not is_cache_valid(cache_dir, sources=_box_stats_sources(data_root, scene),
+                                       version=BOX_STATS_VERSION):
+            stale_scenes.append(scene)
+
+    build_fn = partial(_build_scene_box_stats, data_root=data_root, cache_root=cache_root)
+    return parallel_map(build_fn, [(i, annotations.annotations[i]) for i in stale_scenes],
+                        workers=workers, executor='process')
+
+
+class BoxStatsIndex:
+    """ Query stored per box 3D statistics by (scene, image, box row).
+
+        Statistics of a scene are memory mapped on first query. The box row is the index of the box
+    in the boxes of its image as returned by *AVDAnnotations.get_image_boxes*.
+    """
+
+    STATS_KEYS = ('num_pixels', 'median_depth', 'depth_lo', 'depth_hi', 'camera_centroid',
+                  'world_centroid')
+
+    def __init__(self, data_root, cache_root=None):
+        self.data_root = data_root
+        self.cache_root = cache_root
+        self.scene_stats = dict()
+        self._name2idx = dict()
+
+    def _get_scene(self, scene):
+        if scene not in self.scene_stats:
+            cache_dir = get_cache_dir(self.data_root, scene, BOX_STATS_NAME,
+                                      cache_root=self.cache_root)
+            self.scene_stats[scene] = stats = load_arrays(cache_dir)
+            self._name2idx[scene] = {n: i for i, n in enumerate(stats['image_names'].tolist())}
+        return self.scene_stats[scene]
+
+    def _image_rows(self, scene, image):
+        stats = self._get_scene(scene)
+        idx = self._name2idx[scene][image] if isinstance(image, str) else image
+        return stats['box_offsets'][idx], stats['box_offsets'][idx + 1]
+
+    def get(self, scene, image, box_row):
+        """ Get statistics of a single box.
+
+        Parameters
+        ----------
+        scene: str
+            Name of the scene.
+        image: str or int
+            Name or index of the image in the scene.
+        box_row: int
+            Index of the box in the boxes of the image.
+
+        Returns
+        -------
+        dict
+            Value of each statistic. See *compute_scene_box_stats*.
+        """
+        start, end = self._image_rows(scene, image)
+        if not 0 <= box_row < end - start:
+            raise IndexError(f'Box row {box_row} out of range for {end - start} boxes of {image}.')
+        stats = self._get_scene(scene)
+        return {k: stats[k][start + box_row] for k in self.STATS_KEYS}
+
+    def get_image(self, scene, image):
+        """ Get statistics of all boxes of an image as views of shape (num_boxes, ...). """
+        start, end = self._image_rows(scene, image)
+        stats = self._get_scene(scene)
+        return {k: stats[k][start:end] for k in self.STATS_KEYS}
+
+
+if __name__ == '__main__':
+    import argparse
+    from activevision.annotations import AVDAnnotations
+    from activevision.defaults import AVD_DATASET, ALL_SCENES
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenes', '-s', type=str, nargs='*', default=ALL_SCENES,
+                        help='Scenes to compute. Computes all scenes by default.')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help='Number of processes.')
+    parser.add_argument('--force', action='store_true',
+                        help='Recompute scenes with up to date statistics.')
+
+    args = parser.parse_args()
+
+    avd = AVDAnnotations(data_root=AVD_DATASET, use_cache=True)
+    avd.load_annotations(scenes=args.scenes)
+    print(f'Recomputed: {build_box_stats(avd, workers=args.workers, force=args.force)}')
@@ -1,35 +1,253 @@
 import os
+import warnings
+import numpy as np
+
 from .defaults import camera
 
+CAMERA_PARAMS_FOLDER = 'camera_params'
+CAMERA_PARAMS_FILENAME = 'cameras.txt'
+
+# Intrinsics registries by dataset root, see *get_intrinsics_registry*
+_REGISTRIES = dict()
 
-def load_camera_params(dataset_root, scene, return_default=False):
-    CAMERA_PARAMS_FOLDER = 'camera_params'
-    CAMERA_PARAMS_FILENAME = 'cameras.txt'
 
-    camera_params_path = os.path.join(dataset_root, CAMERA_PARAMS_FOLDER)
+def camera_params_path(dataset_root, scene):
+    """ Get path of the cameras.txt of a scene, inside the camera_params folder if it exists. """
+    params_folder = os.path.join(dataset_root, CAMERA_PARAMS_FOLDER)
 
-    if os.path.isdir(camera_params_path):
-        scene_params_path = os.path.join(camera_params_path, scene)
+    if os.path.isdir(params_folder):
+        scene_params_path = os.path.join(params_folder, scene)
     else:
         scene_params_path = os.path.join(dataset_root, scene)
 
-    scene_params_path = os.path.join(scene_params_path, CAMERA_PARAMS_FILENAME)
-
-    if os.path.isfile(scene_params_path):
-        with open(scene_params_path, 'r') as f:
-            file_contents = f.read()
-        params_line = file_contents.split('\n')[3]
-        params_split = params_line.split(' ')
-
-        return {
-            'fx': float(params_split[4]),
-            'fy': float(params_split[5]),
-            'cx': float(params_split[6]),
-            'cy': float(params_split[7])
-        }
-    elif return_default:
-        print(f'Camera parameters not found for **{scene}** in \n\t {scene_params_path}.'
-              '\nReturning default values.')
-        return camera['intrinsics']
-    else:
-        raise FileNotFoundError(f'Path {scene_params_path} does not exists!')
+    return os.path.join(scene_params_path, CAMERA_PARAMS_FILENAME)
+
+
+def read_camera_params(scene_params_path):
+    """ Parse fx, fy, cx, cy from the 4th line of a cameras.txt file. """
+    with open(scene_params_path, 'r') as f:
+        file_contents = f.read()
+    params_line = file_contents.split('\n')[3]
+    params_split = params_line.split(' ')
+
+    return {
+        'fx': float(params_split[4]),
+        'fy': float(params_split[5]),
+        'cx': float(params_split[6]),
+        'cy': float(params_split[7])
+    }
+
+
+def params_to_K(params):
+    """ Convert dict of fx, fy, cx, cy to a (3,3) camera matrix. """
+    return np.array([[params['fx'], 0, params['cx']],
+                     [0, params['fy'], params['cy']],
+                     [0, 0, 1]], dtype=np.float64)
+
+
+def scale_K(K, scale):
+    """ Scale camera matrices to an image resized by `scale`.
+
+        Focal lengths and principal points are multiplied by the scale of their axis, which matches
+    downsampling by keeping every n-th pixel as done by the depth stack with scale 1/n.
+
+    Parameters
+    ----------
+    K: numpy array
+        Camera matrix of shape (3,3) or (N,3,3).
+    scale: float or tuple
+        Scale of both axes or (scale_x, scale_y), e.g. 0.5 for half resolution.
+
+    Returns
+    -------
+    numpy array
+        Scaled copy of `K`.
+    """
+    sx, sy = (scale, scale) if np.isscalar(scale) else scale
+    K = np.array(K, dtype=np.float64)
+    K[..., 0, :] *= sx
+    K[..., 1, :] *= sy
+    return K
+
+
+class IntrinsicsRegistry:
+    """ Camera intrinsics of the scenes of a dataset, parsed once per scene.
+
+        Camera matrices and their inverses are cached per scene and scale and are read-only. A
+    scene is parsed again, dropping its cached matrices, when the modification time or size of its
+    cameras.txt changes. Scenes without a cameras.txt use the default intrinsics of
+    *defaults.camera* with a warning if `return_default` is True.
+    """
+
+    def __init__(self, dataset_root, return_default=True):
+        """
+        Parameters
+        ----------
+        dataset_root: str
+            Root of the Active Vision Dataset.
+        return_default: bool, default=True
+            Flag to use default intrinsics for scenes without camera parameters instead of raising
+            FileNotFoundError.
+        """
+        self.dataset_root = dataset_root
+        self.return_default = return_default
+        self._params = dict()  # Scene: dict of fx, fy, cx, cy or None if not found
+        self._signatures = dict()  # Scene: signature of cameras.txt when it was parsed
+        self._paths = dict()  # Scene: path of cameras.txt
+        self._K = dict()  # (scene, scale_x, scale_y): read-only (3,3) K
+        self._K_inv = dict()  # (scene, scale_x, scale_y): read-only (3,3) inverse of K
+
+    def __str__(self):
+        return f'IntrinsicsRegistry({self.dataset_root}). Scenes: {sorted(self._params)}'
+
+    def __contains__(self, scene):
+        return self._load(scene) is not None
+
+    def _load(self, scene, check=True):
+        """ Get parsed parameters of a scene, parsing cameras.txt again if it changed.
+
+            Without `check`, a scene that was already parsed is returned without touching the file.
+        """
+        if not check and scene in self._params:
+            return self._params[scene]
+
+        if scene not in self._paths:
+            self._paths[scene] = camera_params_path(self.dataset_root, scene)
+        path = self._paths[scene]
+        try:
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        if scene not in self._params or self._signatures.get(scene) != signature:
+            self._params[scene] = read_camera_params(path) if signature is not None else None
+            self._signatures[scene] = signature
+            for cache in (self._K, self._K_inv):
+                for key in [i for i in cache if i[0] == scene]:
+                    del cache[key]
+        return self._params[scene]
+
+    def params(self, scene, return_default=None, check=True):
+        """ Get dict of fx, fy, cx, cy of a scene. See *load_camera_params*.
+
+            `check` re-reads cameras.txt if its modification time or size changed since it was
+        parsed, which costs one *os.stat*. Set it to False in tight loops; see *stack*.
+        """
+        return_default = self.return_default if return_default is None else return_default
+        params = self._load(scene, check=check)
+        if params is not None:
+            return dict(params)
+
+        scene_params_path = camera_params_path(self.dataset_root, scene)
+        if not return_default:
+            raise FileNotFoundError(f'Path {scene_params_path} does not exists!')
+        warnings.warn(f'Camera parameters not found for **{scene}** in {scene_params_path}. '
+                      'Using default values.')
+        return dict(camera['intrinsics'])
+
+    @staticmethod
+    def _scale_key(scale):
+        sx, sy = (scale, scale) if np.isscalar(scale) else scale
+        return float(sx), float(sy)
+
+    def K(self, scene, scale=1, check=True):
+        """ Get the (3,3) camera matrix of a scene, scaled for a resized image. See *scale_K*.
+
+            See *params* for `check`.
+        """
+        key = (scene,) + self._scale_key(scale)
+        self._load(scene, check=check)
+        if key not in self._K:
+            K = scale_K(params_to_K(self.params(scene, check=False)), key[1:])
+            K.flags.writeable = False
+            self._K[key] = K
+        return self._K[key]
+
+    def K_inv(self, scene, scale=1, check=True):
+        """ Get the inverse of the camera matrix of a scene. See *K*. """
+        key = (scene,) + self._scale_key(scale)
+        self._load(scene, check=check)
+        if key not in self._K_inv:
+            K_inv = np.linalg.inv(self.K(scene, scale=scale, check=False))
+            K_inv.flags.writeable = False
+            self._K_inv[key] = K_inv
+        return self._K_inv[key]
+
+    def stack(self, scenes, scale=1, inverse=False):
+        """ Stack camera matrices of the scenes of many frames.
+
+            cameras.txt of each distinct scene is checked for changes once per call.
+
+        Parameters
+        ----------
+        scenes: list
+            Scene of each frame, e.g. of each image of a batch. Repeated scenes share one lookup.
+            Use *stack_images* for (scene, image name) pairs.
+        scale: float or tuple, default=1
+            Scale of the images. See *scale_K*.
+        inverse: bool, default=False
+            Flag to stack inverses of the camera matrices instead.
+
+        Returns
+        -------
+        numpy array
+            Array of shape (len(scenes), 3, 3) in the order of `scenes`.
+        """
+        unique_scenes, inverse_idx = np.unique(np.asarray(scenes, dtype=str), return_inverse=True)
+        get = self.K_inv if inverse else self.K
+        Ks = np.stack([get(i, scale=scale) for i in unique_scenes.tolist()]) \
+            if len(unique_scenes) > 0 else np.empty((0, 3, 3), dtype=np.float64)
+        return Ks[inverse_idx.reshape(-1)]
+
+    def stack_images(self, scene_images, scale=1, inverse=False):
+        """ Stack camera matrices of many images.
+
+            Image names of the dataset do not identify their scene, so images are given along with
+        their scene. All images of a scene share its camera matrix. See *stack* for the other
+        parameters.
+
+        Parameters
+        ----------
+        scene_images: list
+            (scene, image name) pair of each image.
+
+        Returns
+        -------
+        numpy array
+            Array of shape (len(scene_images), 3, 3) in the order of `scene_images`.
+        """
+        return self.stack([scene for scene, _ in scene_images], scale=scale, inverse=inverse)
+
+    def clear(self):
+        self._params.clear()
+        self._signatures.clear()
+        self._paths.clear()
+        self._K.clear()
+        self._K_inv.clear()
+
+
+def get_intrinsics_registry(dataset_root):
+    """ Get the shared intrinsics registry of a dataset, creating it on first use. """
+    if dataset_root not in _REGISTRIES:
+        _REGISTRIES[dataset_root] = IntrinsicsRegistry(dataset_root)
+    return _REGISTRIES[dataset_root]
+
+
+def load_camera_params(dataset_root, scene, return_default=False):
+    """ Get dict of fx, fy, cx, cy of a scene. cameras.txt files are parsed only once.
+
+    Parameters
+    ----------
+    dataset_root: str
+        Root of the Active Vision Dataset.
+    scene: str
+        Name of the scene.
+    return_default: bool, default=False
+        Flag to return the default intrinsics with a warning when the scene has no camera
+        parameters instead of raising FileNotFoundError.
+
+    Returns
+    -------
+    dict
+    """
+    return get_intrinsics_registry(dataset_root).params(scene, return_default=return_default)
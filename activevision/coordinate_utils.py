@@ -1,5 +1,97 @@
 import numpy as np
 
+from activevision.utils.lru_cache import LRUCache
+
+# Ray grids of recently used intrinsics, keyed by (width, height, fx, fy, cx, cy)
+_RAY_GRIDS = LRUCache(max_items=4)
+
+
+class RayGrid:
+    """ Back-projection rays of every pixel for a set of camera intrinsics.
+
+        Holds the (3, height*width) array of [(x-cx)/fx, (y-cy)/fy, 1] for every pixel in row major
+    order, so that the camera coordinates of a depth image are a single multiplication of the
+    flattened depth with the rays. The full array takes 24 bytes per pixel and is only built on
+    first access of `rays`; `x_rays` and `y_rays` hold the per column and per row factors and are
+    enough to back-project parts of an image. Use *get_ray_grid* to share grids between calls.
+    """
+
+    def __init__(self, width, height, fx, fy, cx, cy):
+        self.key = (int(width), int(height), float(fx), float(fy), float(cx), float(cy))
+        self.width, self.height = int(width), int(height)
+        self.fx, self.fy, self.cx, self.cy = float(fx), float(fy), float(cx), float(cy)
+
+        self.x_rays = (np.arange(self.width) - self.cx) / self.fx  # (imw,)
+        self.y_rays = (np.arange(self.height) - self.cy) / self.fy  # (imh,)
+        self.x_rays.flags.writeable = False
+        self.y_rays.flags.writeable = False
+        self._rays = None
+        self._pixel_xy = None
+
+    @property
+    def rays(self):
+        if self._rays is None:
+            rays = np.empty((3, self.height, self.width), dtype=np.float64)
+            rays[0] = self.x_rays[None, :]
+            rays[1] = self.y_rays[:, None]
+            rays[2] = 1
+            rays = rays.reshape(3, -1)
+            rays.flags.writeable = False
+            self._rays = rays
+        return self._rays
+
+    def backproject(self, depth, out=None):
+        """ Project depth image to camera coordinate.
+
+        Parameters
+        ----------
+        depth: numpy array
+            Depth image of shape (height, width) or its flattened version.
+        out: numpy array or None, default=None
+            Preallocated float64 array of shape (3, height*width) to write the output to.
+
+        Returns
+        -------
+        numpy array
+            Point cloud of shape (3, height*width) in row major pixel order.
+        """
+        z_flat = np.asarray(depth).reshape(-1)
+        assert len(z_flat) == self.rays.shape[1], \
+            f'Depth size {len(z_flat)} does not match ray grid {self.height}x{self.width}.'
+        return np.multiply(self.rays, z_flat, out=out)
+
+    def pixel_xy(self):
+        """ Get flattened x and y pixel coordinates in the same order as the rays. Cached. """
+        if self._pixel_xy is None:
+            x_flat = np.tile(np.arange(self.width), self.height)
+            y_flat = np.repeat(np.arange(self.height), self.width)
+            x_flat.flags.writeable = False
+            y_flat.flags.writeable = False
+            self._pixel_xy = (x_flat, y_flat)
+        return self._pixel_xy
+
+
+def get_ray_grid(width, height, fx, fy, cx, cy):
+    """ Get ray grid for intrinsics, building it only on first use.
+
+    Parameters
+    ----------
+    width: int
+        Width of the image.
+    height: int
+        Height of the image.
+    fx, fy: float
+        Focal lengths in x and y direction.
+    cx, cy: float
+        Principal point.
+
+    Returns
+    -------
+    RayGrid
+    """
+    key = (int(width), int(height), float(fx), float(fy), float(cx), float(cy))
+    return _RAY_GRIDS.get(key, loader=lambda k: RayGrid(*k))
+
 
 def generate_flat_xyz(depth_image):
     """ Generate flattened xyz coordinates using depth image.
@@ -188,6 +280,114 @@ def bbox_pixel_indices_list(bounding_boxes, x_flat, y_flat, z_flat,
     return bboxes_xyz_list
 
 
+def bbox_pixel_indices_roi(bounding_box, depth, filter_depth=False,
+                           cluster_depth=True):
+    """ Get indices of pixels inside the bounding box using only its region.
+        Same output as *bbox_pixel_indices* with the flattened axes of
+        `depth`, but the box region is sliced from the depth image and the
+        depth filter is applied there, so the cost scales with the box area
+        instead of the image area.
+
+    Parameters
+    ----------
+    bounding_box: list or numpy array
+        List containing the [xmin, ymin, xmax, ymax] of the bounding box.
+    depth: PIL Image or numpy array
+        Depth image of shape (imh, imw).
+    filter_depth: bool, optional (default=False)
+        Flag for whether to filter the indices that have zero z-values or
+        are outside one standard deviation of the box depth.
+    cluster_depth: bool, optional (default=True)
+        Flag for estimating the box depth from the middle third of the box
+        pixels. See *bbox_pixel_indices*.
+
+    Returns
+    -------
+    matched_indices: numpy array
+        Indices of the row major flattened depth image that correspond to
+        the pixels inside the bounding box.
+    """
+    depth = np.asarray(depth)
+    imh, imw = depth.shape
+
+    # Pixels satisfying xmin <= x <= xmax and ymin <= y <= ymax
+    xmin = max(int(np.ceil(bounding_box[0])), 0)
+    ymin = max(int(np.ceil(bounding_box[1])), 0)
+    xmax = min(int(np.floor(bounding_box[2])), imw - 1)
+    ymax = min(int(np.floor(bounding_box[3])), imh - 1)
+    if xmax < xmin or ymax < ymin:
+        return np.empty(0, dtype=np.int64)
+
+    roi_w = xmax - xmin + 1
+    roi_z = depth[ymin:ymax + 1, xmin:xmax + 1].reshape(-1)
+
+    if filter_depth:
+        valid_z = roi_z != 0
+
+        if cluster_depth:
+            bbox_z = roi_z
+        else:
+            bbox_z = roi_z[valid_z]
+
+        num_bbox_z = len(bbox_z)
+        if cluster_depth:
+            bbox_z = bbox_z[int(0.33*num_bbox_z):int(0.66*num_bbox_z)]
+
+        z_mean = np.average(bbox_z)
+        z_std = np.std(bbox_z)
+        keep = valid_z & (roi_z >= z_mean-1*z_std) & (roi_z <= z_mean+1*z_std)
+        roi_indices = keep.nonzero()[0]
+    else:
+        roi_indices = np.arange(len(roi_z))
+
+    roi_y, roi_x = np.divmod(roi_indices, roi_w)
+    return (roi_y + ymin) * imw + (roi_x + xmin)
+
+
+def bbox_pixel_indices_batch(bounding_boxes, depth, filter_depth=False,
+                             cluster_depth=True, coordinates=False):
+    """ Get either indices or coordinates of pixels for all boxes of a frame.
+        Region based equivalent of *bbox_pixel_indices_list*. See
+        *bbox_pixel_indices_roi*.
+
+    Parameters
+    ----------
+    bounding_boxes: list or numpy array
+        List containing the [[xmin1, ymin1, xmax1, ymax1],
+        [xmin2, ymin2, xmax2, yman2], ...] of each bounding box.
+    depth: PIL Image or numpy array
+        Depth image of shape (imh, imw).
+    filter_depth: bool, optional (default=False)
+        Flag for whether to filter the indices by depth.
+    cluster_depth: bool, optional (default=True)
+        Flag for estimating box depth from the middle third of its pixels.
+    coordinates: bool, optional (default=False)
+        Flag for whether to return (3, num_pts) xyz coordinates instead of
+        indices.
+
+    Returns
+    -------
+    list
+        Indices or coordinates of pixels inside each bounding box.
+    """
+    depth = np.asarray(depth)
+    imw = depth.shape[1]
+    depth_flat = depth.reshape(-1)
+
+    bboxes_xyz_list = []
+    for bbox in bounding_boxes:
+        matched_idx = bbox_pixel_indices_roi(bbox, depth, filter_depth=filter_depth,
+                                             cluster_depth=cluster_depth)
+        if coordinates:
+            y, x = np.divmod(matched_idx, imw)
+            bboxes_xyz_list.append(np.array((x, y, depth_flat[matched_idx]),
+                                            dtype=np.float64))
+        else:
+            bboxes_xyz_list.append(matched_idx)
+
+    return bboxes_xyz_list
+
+
 if __name__ == '__main__':
     w = 5
     h = 4
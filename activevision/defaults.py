@@ -7,10 +7,15 @@ else:
     AVD_DATASET = os.path.join(os.path.dirname(__file__), 'AVD_Dataset')
 IMG_FOLDER = 'jpg_rgb'
 DEPTH_FOLDER = 'high_res_depth'
+CATEGORY_FOLDER = 'AVD_Category_Bboxes'
+CATEGORY_BOXES_FOLDER = 'bboxes'
+# Compiled caches are stored inside the dataset unless specified otherwise
+CACHE_FOLDER = '.avd_cache'
 
 # FILENAMES
 SCENE_ANNOTATIONS_FNAME = 'annotations.json'
 IMG_STRUCT_FNAME = 'image_structs.mat'
+CACHE_META_FNAME = 'meta.json'
 
 # SCENES
 ALL_SCENES = ['Home_001_1', 'Home_001_2', 'Home_002_1', 'Home_003_1', 'Home_003_2', 'Home_004_1',
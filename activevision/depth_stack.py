@@ -0,0 +1,186 @@
+import os
+from functools import partial
+import numpy as np
+from PIL import Image
+
+from activevision.annotations import img_name2depth_name
+from activevision.utils.cache_utils import get_cache_dir, is_cache_valid, read_cache_meta, \
+    invalidate_cache, write_cache_meta, load_arrays, directory_sources
+from activevision.utils.parallel_utils import parallel_map
+from activevision.defaults import DEPTH_FOLDER
+
+DEPTH_STACK_NAME = 'depth_stack'
+DEPTH_STACK_VERSION = 1
+
+
+def depth_stack_name(stride=1):
+    """ Get cache name of the depth stack of a downsampling stride. """
+    return DEPTH_STACK_NAME if stride == 1 else f'{DEPTH_STACK_NAME}_s{stride}'
+
+
+def depth_stack_sources(depth_dir):
+    """ Get the depth folder and every depth image in it as sources of a depth stack. """
+    return directory_sources(depth_dir, '.png')
+
+
+def _decode_depth_into(row_and_path, out, stride=1):
+    row, path = row_and_path
+    with Image.open(path) as depth:
+        out[row] = np.asarray(depth)[::stride, ::stride]
+
+
+def compile_depth_stack(data_root, scene, stride=1, cache_root=None, workers=None):
+    """ Transcode the depth images of a scene into a single memory mappable uint16 array.
+
+        Depth images are sorted by name, which orders them by image id, and decoded once into an
+    (N, H, W) array written directly to disk. A `stride` greater than 1 keeps every stride-th row
+    and column, i.e. nearest neighbor downsampling, so that invalid zero depths are never mixed
+    with valid ones.
+
+    Parameters
+    ----------
+    data_root: str
+        Root of the Active Vision Dataset.
+    scene: str
+        Name of the scene.
+    stride: int, default=1
+        Downsampling stride.
+    cache_root: str or None, default=None
+        Root folder for all caches. See *get_cache_dir*.
+    workers: int or None, default=None
+        Number of threads decoding images concurrently.
+
+    Returns
+    -------
+    str
+        Directory of the compiled depth stack.
+    """
+    assert stride >= 1, f'Invalid stride: {stride}'
+    depth_dir = os.path.join(data_root, scene, DEPTH_FOLDER)
+    depth_names = sorted(i for i in os.listdir(depth_dir) if i.endswith('.png'))
+    assert len(depth_names) > 0, f'No depth images found in {depth_dir}'
+
+    with Image.open(os.path.join(depth_dir, depth_names[0])) as depth:
+        width, height = depth.size
+    shape = (len(depth_names), len(range(0, height, stride)), len(range(0, width, stride)))
+
+    cache_dir = get_cache_dir(data_root, scene, depth_stack_name(stride), cache_root=cache_root)
+    invalidate_cache(cache_dir)
+    np.save(os.path.join(cache_dir, 'image_names.npy'), np.array(depth_names))
+    depths = np.lib.format.open_memmap(os.path.join(cache_dir, 'depths.npy'), mode='w+',
+                                       dtype=np.uint16, shape=shape)
+
+    # PIL releases the GIL while decoding, so threads can write rows of the same memmap
+    decode_fn = partial(_decode_depth_into, out=depths, stride=stride)
+    parallel_map(decode_fn, [(row, os.path.join(depth_dir, name))
+                             for row, name in enumerate(depth_names)],
+                 workers=workers, executor='thread')
+    depths.flush()
+    del depths
+
+    write_cache_meta(cache_dir, ['depths', 'image_names'], sources=depth_stack_sources(depth_dir),
+                     version=DEPTH_STACK_VERSION, extra_meta={'stride': stride})
+    return cache_dir
+
+
+class DepthStack:
+    """ Memory mapped depth images of a scene indexed by image name.
+
+        Indexing with a depth image name or the name of its rgb image returns a zero-copy view of
+    shape (H, W) into the stack.
+    """
+
+    def __init__(self, depths, image_names, stride=1):
+        self.depths = depths
+        self.image_names = image_names
+        self.stride = stride
+        self.name2row = {name: row for row, name in enumerate(image_names.tolist())}
+
+    @classmethod
+    def load(cls, cache_dir, mmap_mode='r'):
+        arrays = load_arrays(cache_dir, mmap_mode=mmap_mode)
+        return cls(depths=arrays['depths'], image_names=arrays['image_names'],
+                   stride=read_cache_meta(cache_dir)['stride'])
+
+    @staticmethod
+    def _depth_name(name):
+        return name if name.endswith('.png') else img_name2depth_name(name)
+
+    @property
+    def shape(self):
+        return self.depths.shape
+
+    def __len__(self):
+        return len(self.image_names)
+
+    def __contains__(self, name):
+        return self._depth_name(name) in self.name2row
+
+    def rows(self, names):
+        """ Get rows of images by depth or rgb name. Raises KeyError for unknown names. """
+        if isinstance(names, str):
+            return self.name2row[self._depth_name(names)]
+        return np.array([self.name2row[self._depth_name(i)] for i in names], dtype=np.int64)
+
+    def __getitem__(self, name):
+        return self.depths[self.rows(name)]
+
+    def get_many(self, names):
+        """ Get depths of many images as an array of shape (B, H, W). Copies the data. """
+        return self.depths[self.rows(names)]
+
+
+def load_depth_stack(data_root, scene, stride=1, cache_root=None, workers=None, mmap_mode='r'):
+    """ Load the depth stack of a scene, compiling it first if missing or stale.
+
+        The stack is stale when depth images of the scene were added, removed or modified, which
+    is checked with the modification time and size of every depth image.
+
+    Parameters
+    ----------
+    data_root: str
+        Root of the Active Vision Dataset.
+    scene: str
+        Name of the scene.
+    stride: int, default=1
+        Downsampling stride. See *compile_depth_stack*.
+    cache_root: str or None, default=None
+        Root folder for all caches. See *get_cache_dir*.
+    workers: int or None, default=None
+        Number of threads used when compiling.
+    mmap_mode: str or None, default='r'
+        Memory map mode of the stack.
+
+    Returns
+    -------
+    DepthStack
+    """
+    cache_dir = get_cache_dir(data_root, scene, depth_stack_name(stride), cache_root=cache_root)
+    depth_dir = os.path.join(data_root, scene, DEPTH_FOLDER)
+    if not is_cache_valid(cache_dir, sources=depth_stack_sources(depth_dir),
+                          version=DEPTH_STACK_VERSION):
+        compile_depth_stack(data_root, scene, stride=stride, cache_root=cache_root,
+                            workers=workers)
+    return DepthStack.load(cache_dir, mmap_mode=mmap_mode)
+
+
+if __name__ == '__main__':
+    import argparse
+    from activevision.defaults import AVD_DATASET, ALL_SCENES
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenes', '-s', type=str, nargs='*', default=ALL_SCENES,
+                        help='Scenes to transcode. Transcodes all scenes by default.')
+    parser.add_argument('--stride', type=int, default=1,
+                        help='Downsampling stride of the depth images.')
+    parser.add_argument('--cache-root', type=str, default=None,
+                        help='Root folder for caches. Defaults to a folder inside the dataset.')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help='Number of decoding threads.')
+
+    args = parser.parse_args()
+
+    for s in args.scenes:
+        stack = load_depth_stack(AVD_DATASET, s, stride=args.stride, cache_root=args.cache_root,
+                                 workers=args.workers)
+        print(f'{s}: {stack.shape} depth stack')
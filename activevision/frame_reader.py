@@ -0,0 +1,232 @@
+import time
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+from activevision.utils.lru_cache import LRUCache
+from activevision.utils.parallel_utils import parallel_map
+
+
+def decode_frame(path, size=None, mode='RGB', return_source_size=False, scale=None):
+    """ Decode an rgb image, using reduced resolution JPEG decoding when possible.
+
+        With a target size, the JPEG decoder is first set to the smallest of the 1/2, 1/4 and 1/8
+    scales that is not smaller than the target (see *PIL.Image.Image.draft*), so only the remaining
+    factor is resized instead of decoding the full image.
+
+    Parameters
+    ----------
+    path: str
+        Path of the image.
+    size: tuple or None, default=None
+        Target (width, height). Full resolution when None.
+    mode: 'RGB' or 'RGBA', default='RGB'
+        Channels of the decoded frame. RGBA frames are drawn faster by matplotlib.
+    return_source_size: bool, default=False
+        Flag to also return the (width, height) of the image file.
+    scale: float or None, default=None
+        Target size as a scale of the size of the image file, used instead of `size`. Avoids
+        opening the file once more to read its size.
+
+    Returns
+    -------
+    frame: numpy array
+        Uint8 array of shape (height, width, 3) or (height, width, 4) for RGBA.
+    source_size: tuple
+        Only returned if `return_source_size` is True.
+    """
+    assert mode in ('RGB', 'RGBA'), f'Invalid mode {mode}!'
+    assert size is None or scale is None, 'Only one of size and scale can be specified.'
+    with Image.open(path) as img:
+        source_size = img.size
+        if scale is not None and scale != 1:
+            size = tuple(max(int(round(i * scale)), 1) for i in source_size)
+        if size is not None:
+            img.draft('RGB', tuple(size))
+        img = img.convert(mode)
+        if size is not None and img.size != tuple(size):
+            img = img.resize(tuple(size), resample=Image.BILINEAR)
+        frame = np.asarray(img)
+
+    if return_source_size:
+        return frame, source_size
+    return frame
+
+
+class FrameReader:
+    """ Cached access to rgb frames of loaded scenes at a target resolution.
+
+        Decoded frames are kept in a least recently used cache bounded by `max_frames` and
+    `max_bytes`. Returned arrays are shared with the cache and are read-only. Frames can be
+    decoded ahead of time in background threads with *prefetch*.
+    """
+
+    def __init__(self, annotations, size=None, max_frames=256, max_bytes=None, workers=4,
+                 mode='RGB'):
+        """
+        Parameters
+        ----------
+        annotations: AVDAnnotations
+            Annotations used to find the path of images.
+        size: tuple or None, default=None
+            Target (width, height) of frames. Full resolution when None.
+        max_frames: int or None, default=256
+            Maximum number of cached frames. Unbounded when None.
+        max_bytes: int or None, default=None
+            Maximum memory of cached frames in bytes. Unbounded when None.
+        workers: int or None, default=4
+            Number of threads decoding frames in *get_many* and *prefetch*.
+        mode: 'RGB' or 'RGBA', default='RGB'
+            Channels of the frames. See *decode_frame*.
+        """
+        self.annotations = annotations
+        self.size = None if size is None else tuple(size)
+        self.workers = workers
+        self.mode = mode
+        # (scene, name): (frame, (width, height) of the image file)
+        self.frames = LRUCache(loader=self._load, max_items=max_frames, max_bytes=max_bytes)
+        self.decoded = 0
+        self.decode_time = 0.
+        self.requests = 0
+        self.cache_hits = 0
+        self.prefetch_hits = 0
+        self.prefetch_waits = 0
+        self._lock = threading.RLock()
+        self._executor = None
+        self._pending = dict()  # (scene, name): Future of a prefetched frame
+
+    def __str__(self):
+        return f'FrameReader(size={self.size}). Stats: {self.stats()}'
+
+    def _load(self, key):
+        scene, name = key
+        start = time.perf_counter()
+        frame, source_size = decode_frame(self.annotations.img_name2path(scene=scene, name=name),
+                                          size=self.size, mode=self.mode,
+                                          return_source_size=True)
+        elapsed = time.perf_counter() - start
+        frame.flags.writeable = False
+
+        with self._lock:
+            self.decoded += 1
+            self.decode_time += elapsed
+        return frame, source_size
+
+    def _get_entry(self, key):
+        # Count requests served from the cache or from a prefetch, which are both not decoded by
+        # the caller, unlike the misses of the frame cache that include prefetched frames
+        with self._lock:
+            self.requests += 1
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.prefetch_hits += 1
+                self.prefetch_waits += not pending.done()
+            elif key in self.frames:
+                self.cache_hits += 1
+        if pending is not None:
+            return pending.result()
+        return self.frames.get(key)
+
+    def get(self, scene, name):
+        """ Get the frame of an image as a read-only uint8 array of shape (height, width, 3).
+
+            Waits for the frame if it is being prefetched instead of decoding it again.
+        """
+        return self._get_entry((scene, name))[0]
+
+    def source_size(self, scene, name):
+        """ Get (width, height) of the image file of a frame, e.g. to scale boxes to the frame.
+
+            Stored with the cached frame, so the frame is decoded again if it was evicted.
+        """
+        entry = self.frames.peek((scene, name))
+        return entry[1] if entry is not None else self._get_entry((scene, name))[1]
+
+    def prefetch(self, scene, names):
+        """ Decode frames of images in background threads without waiting for them.
+
+            Frames that are already cached or being prefetched are skipped.
+
+        Parameters
+        ----------
+        scene: str
+            Scene of the images.
+        names: list
+            Names of the images, decoded in the given order.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(self.workers or 1, 1))
+            for name in names:
+                key = (scene, name)
+                if key in self._pending or key in self.frames:
+                    continue
+                future = self._executor.submit(self.frames.get, key)
+                self._pending[key] = future
+                future.add_done_callback(partial(self._prefetch_done, key))
+
+    def _prefetch_done(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def get_many(self, scene, names):
+        """ Get frames of many images, decoding cache misses in a thread pool.
+
+        Parameters
+        ----------
+        scene: str
+            Scene of the images.
+        names: list
+            Names of the images.
+
+        Returns
+        -------
+        list
+            Frames in the order of `names`.
+        """
+        entries = parallel_map(self._get_entry, [(scene, i) for i in names],
+                               workers=self.workers, executor='thread')
+        return [i[0] for i in entries]
+
+    def __contains__(self, key):
+        return key in self.frames
+
+    def stats(self):
+        """ Get decode time and cache counters.
+
+        Returns
+        -------
+        dict
+            'decoded' number of decoded frames, 'decode_time' total seconds spent decoding,
+            'mean_decode_ms', 'requests' number of requested frames, 'hit_rate' fraction of them
+            served from the cache or from a prefetch, 'prefetch_hits' requests served from a
+            prefetch, 'prefetch_waits' of which were still being decoded, and the frame cache
+            counters of *LRUCache.stats* prefixed with 'cache_'. Frame cache misses include the
+            frames decoded by prefetching.
+        """
+        with self._lock:
+            stats = {'decoded': self.decoded, 'decode_time': self.decode_time,
+                     'mean_decode_ms': 1000 * self.decode_time / self.decoded
+                     if self.decoded > 0 else 0.,
+                     'requests': self.requests,
+                     'hit_rate': (self.cache_hits + self.prefetch_hits) / self.requests
+                     if self.requests > 0 else 0.,
+                     'prefetch_hits': self.prefetch_hits, 'prefetch_waits': self.prefetch_waits}
+        stats.update({f'cache_{k}': v for k, v in self.frames.stats().items()})
+        return stats
+
+    def clear(self):
+        self.frames.clear()
+
+    def close(self):
+        """ Stop background prefetching. Pending frames are still decoded. """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,143 @@
+import numpy as np
+
+from activevision.defaults import ALL_DIRECTIONS
+
+
+class NavigationGraph:
+    """ Navigation graph of a scene as an integer transition table.
+
+        transitions[i, a] is the index of the image reached from image i with the action at index
+    a of *ALL_DIRECTIONS* and -1 when the move is not possible. All methods operate on batches of
+    agents at once.
+    """
+
+    def __init__(self, transitions, image_names=None):
+        """
+        Parameters
+        ----------
+        transitions: numpy array
+            Array of shape (num_images, len(ALL_DIRECTIONS)) with index of the neighbor images.
+        image_names: numpy array or None, default=None
+            Names of the images for converting indices back to names.
+        """
+        transitions = np.ascontiguousarray(transitions, dtype=np.int32)
+        assert transitions.ndim == 2 and transitions.shape[1] == len(ALL_DIRECTIONS), \
+            f'Transitions must be of shape (num_images, {len(ALL_DIRECTIONS)}): {transitions.shape}'
+        self.transitions = transitions
+        self.image_names = image_names
+
+    @classmethod
+    def from_scene_annotations(cls, scene_ann):
+        return cls(transitions=scene_ann.neighbors, image_names=scene_ann.image_names)
+
+    def __len__(self):
+        return len(self.transitions)
+
+    @staticmethod
+    def action_ids(directions):
+        """ Convert direction name(s) to action indices in *ALL_DIRECTIONS*. """
+        if isinstance(directions, str):
+            return ALL_DIRECTIONS.index(directions)
+        return np.array([ALL_DIRECTIONS.index(i) for i in directions], dtype=np.int64)
+
+    def valid_actions(self, positions):
+        """ Get (num_agents, num_actions) boolean mask of possible moves of each agent. """
+        return self.transitions[positions] >= 0
+
+    def step(self, positions, actions, stay_on_invalid=True):
+        """ Advance a batch of agents by one move.
+
+        Parameters
+        ----------
+        positions: numpy array
+            Image index of each agent of shape (num_agents,).
+        actions: numpy array or int
+            Action index of each agent of shape (num_agents,) or a single action for all agents.
+        stay_on_invalid: bool, default=True
+            Flag to keep agents in place when their move is not possible. Otherwise, their new
+            position is -1.
+
+        Returns
+        -------
+        numpy array
+            New image index of each agent of shape (num_agents,).
+        """
+        positions = np.asarray(positions)
+        next_positions = self.transitions[positions, actions]
+        if stay_on_invalid:
+            next_positions = np.where(next_positions < 0, positions, next_positions)
+        return next_positions
+
+    def sample_actions(self, positions, rng):
+        """ Sample an action uniformly among the possible moves of each agent.
+
+        Parameters
+        ----------
+        positions: numpy array
+            Image index of each agent of shape (num_agents,).
+        rng: numpy.random.Generator
+            Random number generator.
+
+        Returns
+        -------
+        numpy array
+            Action index of each agent of shape (num_agents,). -1 for agents with no possible move.
+        """
+        valid = self.valid_actions(positions)
+        num_valid = valid.sum(axis=1)
+        # Pick the k-th possible move of each agent
+        k = (rng.random(len(num_valid)) * num_valid).astype(np.int64)
+        actions = np.argmax(np.cumsum(valid, axis=1) > k[:, None], axis=1)
+        actions[num_valid == 0] = -1
+        return actions
+
+    def random_walks(self, starts, length, seed=None, valid_only=True):
+        """ Sample random walks for a batch of agents.
+
+        Parameters
+        ----------
+        starts: numpy array
+            Starting image index of each walk of shape (num_walks,).
+        length: int
+            Number of moves in each walk.
+        seed: int, numpy.random.Generator or None, default=None
+            Seed of the random number generator.
+        valid_only: bool, default=True
+            Flag to sample only among possible moves. Otherwise, actions are sampled uniformly and
+            agents stay in place on impossible moves. Agents with no possible move always stay.
+
+        Returns
+        -------
+        positions: numpy array
+            Array of shape (num_walks, length+1) with image index at each step of each walk.
+        actions: numpy array
+            Array of shape (num_walks, length) with action index taken at each step. -1 when an
+            agent had no possible move.
+        """
+        rng = np.random.default_rng(seed)
+        starts = np.asarray(starts, dtype=np.int32).reshape(-1)
+
+        positions = np.empty((len(starts), length + 1), dtype=np.int32)
+        actions = np.empty((len(starts), length), dtype=np.int8)
+        positions[:, 0] = starts
+
+        for i in range(length):
+            current = positions[:, i]
+            if valid_only:
+                step_actions = self.sample_actions(current, rng)
+            else:
+                step_actions = rng.integers(len(ALL_DIRECTIONS), size=len(current))
+            next_positions = self.transitions[current, step_actions]
+            # Agents without a possible move (-1 action) or with impossible moves stay in place
+            stay = np.logical_or(step_actions < 0, next_positions < 0)
+            positions[:, i + 1] = np.where(stay, current, next_positions)
+            actions[:, i] = np.where(step_actions < 0, -1, step_actions)
+
+        return positions, actions
+
+    def idx2names(self, indices):
+        """ Convert image indices to names. -1 indices are converted to empty strings. """
+        assert self.image_names is not None, 'Image names are not available.'
+        indices = np.asarray(indices)
+        names = self.image_names[np.maximum(indices, 0)]
+        return np.where(indices < 0, '', names)
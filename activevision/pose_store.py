@@ -0,0 +1,147 @@
+import os
+import numpy as np
+
+from activevision.utils.matlab_utils import load_image_struct, image_struct_to_arrays
+from activevision.utils.cache_utils import get_cache_dir, is_cache_valid, save_arrays, load_arrays
+from activevision.defaults import IMG_STRUCT_FNAME
+
+POSE_CACHE_NAME = 'poses'
+POSE_CACHE_VERSION = 1
+
+
+class PoseStore:
+    """ Camera poses of a scene indexed by image name.
+
+        Holds contiguous arrays of the world to camera translation t (N,3) and rotation R (N,3,3),
+    the world position (N,3) of each image and the scale of the scene, along with a hash index from
+    image name to row. Missing poses are NaN and flagged in `pose_valid`.
+    """
+
+    def __init__(self, image_names, t, R, world_pos, pose_valid, scale):
+        self.image_names = image_names
+        self.t = t
+        self.R = R
+        self.world_pos = world_pos
+        self.pose_valid = pose_valid
+        self.scale = scale
+        self.name2row = {name: row for row, name in enumerate(image_names.tolist())}
+
+    @classmethod
+    def from_image_struct(cls, image_struct, scale):
+        """ Create from the output of *load_image_struct*.
+
+        Parameters
+        ----------
+        image_struct: numpy array
+            Image struct record array.
+        scale: int or float
+            Scale of the scene.
+
+        Returns
+        -------
+        PoseStore
+        """
+        arrays = image_struct_to_arrays(image_struct)
+        return cls(image_names=arrays['image_name'], t=arrays['t'], R=arrays['R'],
+                   world_pos=arrays['world_pos'], pose_valid=arrays['pose_valid'],
+                   scale=float(scale))
+
+    @classmethod
+    def load(cls, cache_dir, mmap_mode='r'):
+        arrays = load_arrays(cache_dir, mmap_mode=mmap_mode)
+        return cls(image_names=arrays['image_names'], t=arrays['t'], R=arrays['R'],
+                   world_pos=arrays['world_pos'], pose_valid=arrays['pose_valid'],
+                   scale=float(arrays['scale'][0]))
+
+    def save(self, cache_dir, sources, version):
+        save_arrays(cache_dir, {'image_names': self.image_names, 't': self.t, 'R': self.R,
+                                'world_pos': self.world_pos, 'pose_valid': self.pose_valid,
+                                'scale': np.array([self.scale])},
+                    sources=sources, version=version)
+
+    def __len__(self):
+        return len(self.image_names)
+
+    def __contains__(self, image_name):
+        return image_name in self.name2row
+
+    def rows(self, image_names):
+        """ Get rows of images by name.
+
+        Parameters
+        ----------
+        image_names: list or str
+            Name(s) of the images.
+
+        Returns
+        -------
+        numpy array or int
+            Row of each image. Raises KeyError for unknown names.
+        """
+        if isinstance(image_names, str):
+            return self.name2row[image_names]
+        return np.array([self.name2row[i] for i in image_names], dtype=np.int64)
+
+    def _as_rows(self, keys):
+        if isinstance(keys, str) or (len(keys) > 0 and isinstance(keys[0], str)):
+            return self.rows(keys)
+        return np.asarray(keys, dtype=np.int64)
+
+    def get_tR(self, keys, scaled=False):
+        """ Get world to camera translation and rotation of images.
+
+        Parameters
+        ----------
+        keys: str, list or numpy array
+            Name of an image, list of names or array of rows.
+        scaled: bool, default=False
+            Flag to multiply translation with the scale of the scene.
+
+        Returns
+        -------
+        t: numpy array
+            Translation of shape (3,1) for a single name, else (B,3,1).
+        R: numpy array
+            Rotation of shape (3,3) for a single name, else (B,3,3).
+        """
+        rows = self._as_rows(keys)
+        t = self.t[rows][..., None]
+        if scaled:
+            t = t * self.scale
+        return t, self.R[rows]
+
+    def get_world_pos(self, keys):
+        """ Get world position of shape (3,) for a single name, else (B,3). See *get_tR*. """
+        return self.world_pos[self._as_rows(keys)]
+
+
+def load_pose_store(data_root, scene, cache_root=None, mmap_mode='r'):
+    """ Load poses of a scene from the memory mapped cache, building it first if missing or stale.
+
+        The cache is stale when modification time or size of the scene's image_structs.mat changed.
+    Later loads skip reading the .mat file.
+
+    Parameters
+    ----------
+    data_root: str
+        Root of the Active Vision Dataset.
+    scene: str
+        Name of the scene.
+    cache_root: str or None, default=None
+        Root folder for all caches. See *get_cache_dir*.
+    mmap_mode: str or None, default='r'
+        Memory map mode of the cached arrays.
+
+    Returns
+    -------
+    PoseStore
+    """
+    mat_path = os.path.join(data_root, scene, IMG_STRUCT_FNAME)
+    cache_dir = get_cache_dir(data_root, scene, POSE_CACHE_NAME, cache_root=cache_root)
+
+    if not is_cache_valid(cache_dir, sources=[mat_path], version=POSE_CACHE_VERSION):
+        image_struct, scale = load_image_struct(mat_path)
+        PoseStore.from_image_struct(image_struct, scale).save(cache_dir, sources=[mat_path],
+                                                              version=POSE_CACHE_VERSION)
+
+    return PoseStore.load(cache_dir, mmap_mode=mmap_mode)
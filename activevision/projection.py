@@ -1,8 +1,6 @@
 import numpy as np
 
-from active_vision_utils.parameters import *
-from active_vision_utils.coordinate_utils import generate_flat_xyz
-from active_vision_utils.tR_utils import camera_to_world_tR, inter_camera_tR
+from activevision.coordinate_utils import get_ray_grid
 
 
 def project_xyz_to_camera(x_flat, y_flat, z_flat, center_x,
@@ -51,8 +49,11 @@ def project_xyz_to_camera(x_flat, y_flat, z_flat, center_x,
 
 
 def project_img_to_camera(image, depth, center_x, center_y, focal_x,
-                          focal_y, filter_depth=False, project_rgb=True):
+                          focal_y, filter_depth=False, project_rgb=True, ray_grid=None):
     """ Project 2d image to Camera coordinate.
+        Back-projection multiplies the depth with the cached pixel rays of the
+        intrinsics (see *get_ray_grid*) instead of building a meshgrid for
+        every image.
 
     Parameters
     ----------
@@ -76,6 +77,8 @@ def project_img_to_camera(image, depth, center_x, center_y, focal_x,
         Flag for filtering the pixels that have zero z-values.
     project_rgb: bool, optional (default=True)
         Flag for getting respective rgb values in camera coordinate.
+    ray_grid: RayGrid or None, optional (default=None)
+        Ray grid to use instead of the shared one for the intrinsics.
 
     Returns
     -------
@@ -95,19 +98,124 @@ def project_img_to_camera(image, depth, center_x, center_y, focal_x,
     else:
         rgb = None
 
-    # X and Y coordinate of each pixel in separate matrix
-    # X increases going left to right and remains constant for single column
-    # Y increases going top to bottom and remains constant for single row
-    x_flat, y_flat, z_flat = generate_flat_xyz(depth)
+    imh, imw = depth.shape
+    if ray_grid is None:
+        ray_grid = get_ray_grid(imw, imh, fx=focal_x, fy=focal_y,
+                                cx=center_x, cy=center_y)
+    assert (ray_grid.width, ray_grid.height) == (imw, imh), \
+        f'Ray grid size {ray_grid.width}x{ray_grid.height} does not match depth {imw}x{imh}.'
 
-    pcloud, rgb = project_xyz_to_camera(x_flat, y_flat, z_flat,
-                                        center_x=center_x, center_y=center_y,
-                                        focal_x=focal_x, focal_y=focal_y,
-                                        filter_depth=filter_depth, rgb=rgb)
+    z_flat = depth.reshape(-1)
+    pcloud = ray_grid.backproject(z_flat)  # (3, num_pts)
+
+    if filter_depth:
+        # Find valid indices i.e. those that have non-zero depth values
+        valid_idx = z_flat != 0
+        pcloud = pcloud[:, valid_idx]  # (3, valid_idx)
+
+        if rgb is not None:
+            rgb = rgb[:, valid_idx]
 
     return pcloud, rgb
 
 
+def intrinsics_to_arrays(intrinsics, num_frames):
+    """ Convert intrinsics of one or many frames to per frame arrays.
+
+    Parameters
+    ----------
+    intrinsics: dict or numpy array
+        Dict with 'fx', 'fy', 'cx', 'cy' keys, array [fx, fy, cx, cy] of shape (4,) or
+        (num_frames, 4), or camera matrix of shape (3,3) or (num_frames, 3, 3).
+    num_frames: int
+        Number of frames.
+
+    Returns
+    -------
+    fx, fy, cx, cy: numpy array
+        Arrays of shape (num_frames,).
+    """
+    if isinstance(intrinsics, dict):
+        intrinsics = [intrinsics['fx'], intrinsics['fy'], intrinsics['cx'], intrinsics['cy']]
+    intrinsics = np.asarray(intrinsics, dtype=np.float64)
+
+    if intrinsics.shape[-2:] == (3, 3):
+        intrinsics = np.stack((intrinsics[..., 0, 0], intrinsics[..., 1, 1],
+                               intrinsics[..., 0, 2], intrinsics[..., 1, 2]), axis=-1)
+    assert intrinsics.shape in ((4,), (num_frames, 4)), \
+        f'Invalid shape of intrinsics for {num_frames} frames: {intrinsics.shape}'
+
+    intrinsics = np.broadcast_to(intrinsics, (num_frames, 4))
+    return intrinsics[:, 0], intrinsics[:, 1], intrinsics[:, 2], intrinsics[:, 3]
+
+
+def project_depth_batch(depths, intrinsics, tcw=None, Rcw=None, scale=1,
+                        return_mask=False, dtype=np.float64):
+    """ Project a stack of depth images to camera or world coordinates.
+
+        All frames are back-projected in a single vectorized pass using the
+        column and row factors of the shared ray grid of each distinct set of
+        intrinsics (see *get_ray_grid*). If world to camera poses are given,
+        the clouds are transformed to world coordinates with
+        Xw = Rcw^T (Xc - tcw*scale).
+
+    Parameters
+    ----------
+    depths: numpy array
+        Depth images of shape (num_frames, imh, imw).
+    intrinsics: dict or numpy array
+        Intrinsics shared by all frames or per frame. See *intrinsics_to_arrays*.
+    tcw: numpy array or None, optional (default=None)
+        World to Camera translation of each frame of shape (num_frames, 3, 1)
+        or (num_frames, 3), e.g. from *PoseStore.get_tR*.
+    Rcw: numpy array or None, optional (default=None)
+        World to Camera rotation of each frame of shape (num_frames, 3, 3).
+    scale: int or float, optional (default=1)
+        Value multiplied with translations to get depth units.
+    return_mask: bool, optional (default=False)
+        Flag for also returning the mask of pixels with non-zero depth.
+    dtype: numpy dtype, optional (default=np.float64)
+        Data type of the output clouds.
+
+    Returns
+    -------
+    pcloud: numpy array
+        Point clouds of shape (num_frames, 3, imh*imw) in row major pixel
+        order. Pixels with zero depth are kept; use the mask to filter them.
+    mask: numpy array
+        Only if `return_mask` is set. Boolean array of shape
+        (num_frames, imh*imw) of pixels with non-zero depth.
+    """
+    depths = np.asarray(depths)
+    assert depths.ndim == 3, f'Depths must be of shape (num_frames, imh, imw): {depths.shape}'
+    assert (tcw is None) == (Rcw is None), 'Both tcw and Rcw must be provided for world frame.'
+    num_frames, imh, imw = depths.shape
+    fx, fy, cx, cy = intrinsics_to_arrays(intrinsics, num_frames)
+
+    # Frames usually share intrinsics, so look up one ray grid per distinct set
+    params, frame_params = np.unique(np.stack((fx, fy, cx, cy), axis=1), axis=0,
+                                     return_inverse=True)
+    grids = [get_ray_grid(imw, imh, *i) for i in params.tolist()]
+    frame_params = frame_params.reshape(-1)
+    x_rays = np.stack([i.x_rays for i in grids]).astype(dtype)[frame_params]  # (B, imw)
+    y_rays = np.stack([i.y_rays for i in grids]).astype(dtype)[frame_params]  # (B, imh)
+
+    pcloud = np.empty((num_frames, 3, imh, imw), dtype=dtype)
+    pcloud[:, 2] = depths
+    np.multiply(pcloud[:, 2], x_rays[:, None, :], out=pcloud[:, 0])
+    np.multiply(pcloud[:, 2], y_rays[:, :, None], out=pcloud[:, 1])
+    pcloud = pcloud.reshape(num_frames, 3, -1)
+
+    if Rcw is not None:
+        tcw = np.asarray(tcw, dtype=np.float64).reshape(num_frames, 3, 1) * scale
+        pcloud -= tcw.astype(dtype)
+        pcloud = np.einsum('bji,bjn->bin', np.asarray(Rcw, dtype=dtype), pcloud)
+
+    if return_mask:
+        return pcloud, depths.reshape(num_frames, -1) != 0
+    return pcloud
+
+
 def project_camera_to_2d(pcl, center_x, center_y,
                          focal_x, focal_y):
     z = pcl[2, :]
@@ -120,51 +228,29 @@ def project_camera_to_2d(pcl, center_x, center_y,
 if __name__ == '__main__':
     import os
     from PIL import Image
-    from matlab_utils import get_tR, load_image_struct
-    from plot_utils import plot_in_image
+    from activevision.defaults import AVD_DATASET, DEPTH_FOLDER
+    from activevision.camera_param_utils import load_camera_params
+    from activevision.pose_store import load_pose_store
+    from activevision.reprojection import reproject
 
-    # IMPORT IMAGE
+    scene = 'Home_001_1'
+    root_path = os.path.join(AVD_DATASET, scene)
 
     # img1_name = '000110000010101.jpg'
     # img2_name = '000110000860101.jpg'
     img1_name = '000110012940101.jpg'
     img2_name = '000110012950101.jpg'
     depth1_name = img1_name.split('.')[0][:-1] + '3.png'
-    depth2_name = img2_name.split('.')[0][:-1] + '3.png'
-
-    img1 = Image.open(os.path.join(root_path, 'jpg_rgb', img1_name))
-    img2 = Image.open(os.path.join(root_path, 'jpg_rgb', img2_name))
-    depth1 = Image.open(os.path.join(root_path, 'high_res_depth', depth1_name))
-    depth2 = Image.open(os.path.join(root_path, 'high_res_depth', depth2_name))
-
-    # PROJECT 2D IMAGE TO 3D CAMERA COORDINATE
-    pcl_cam1, rgb_cam1 = project_img_to_camera(img1, depth1, filter_depth=False,
-                                               project_rgb=True)
-
-    print(f'The point cloud is of shape: {pcl_cam1.shape}')
-
-    # pcl1, rgb3d1 = project_img_to_camera(img1, depth1)
-    image_struct, scale = load_image_struct(root_path)
-
-    # LOAD CAMERA TRANSFORMATION PARAMETERS
-    tc1w, Rc1w = get_tR(img1_name, image_struct)
-    tc2w, Rc2w = get_tR(img2_name, image_struct)
-    tc1w = tc1w * scale
-    tc2w = tc2w * scale
-    twc1, Rwc1 = camera_to_world_tR(tc1w, Rc1w)
-
-    # FIND CAMERA1 TO CAMERA2 TRANSFORMATION PARAMETERS
-    tc2c1, Rc2c1 = inter_camera_tR(twc1, Rwc1, tc2w, Rc2w)
-
-    # TRANSFORM CAMERA1 TO CAMERA2 COORDINATE SYSTEM
-    pcl_cam21 = np.matmul(Rc2c1, pcl_cam1) + tc2c1
 
-    print(f'The transformed cloud is of shape: {pcl_cam21.shape}')
+    depth1 = np.array(Image.open(os.path.join(root_path, DEPTH_FOLDER, depth1_name)))
 
-    # PROJECT CAMERA2 TO IMAGE2
-    proj_img2 = project_camera_to_2d(pcl_cam21)
+    # LOAD CAMERA PARAMETERS
+    poses = load_pose_store(AVD_DATASET, scene)
+    intrinsics = load_camera_params(AVD_DATASET, scene, return_default=True)
 
-    print(proj_img2.shape)
-    print(proj_img2)
-    print(proj_img2.T)
+    # PROJECT IMAGE1 PIXELS TO IMAGE2 THROUGH CAMERA1 AND CAMERA2 COORDINATES
+    proj_img2, valid = reproject(depth1, poses.get_tR(img1_name), poses.get_tR(img2_name),
+                                 intrinsics, intrinsics, scale=poses.scale)
 
+    print(f'{valid.sum()} of {valid.size} pixels are visible in {img2_name}')
+    print(proj_img2[:, valid].T)
@@ -0,0 +1,143 @@
+import numpy as np
+
+from activevision.coordinate_utils import get_ray_grid
+from activevision.projection import intrinsics_to_arrays
+from activevision.tR_utils import camera_to_world_tR, inter_camera_tR
+
+
+class Reprojector:
+    """ Chunked reprojection of depth pixels from a source view to a target view.
+
+        Fuses back-projection to the source camera, transformation to the target camera and
+    projection to target pixels. Pixels are processed in chunks of whole image rows with at most
+    `chunk_size` pixels (at least one row) using preallocated float64 work buffers of
+    6 * 8 * chunk_size bytes. Rays of each chunk are formed from the per column and per row
+    factors of the *RayGrid*, so the full resolution ray array is never built. Besides the work
+    buffers, memory is the outputs of 9 bytes per source pixel, which are kept and reused across
+    calls; copy the outputs if they must outlive the next call.
+    """
+
+    def __init__(self, width, height, chunk_size=2 ** 18):
+        """
+        Parameters
+        ----------
+        width: int
+            Width of the source depth images.
+        height: int
+            Height of the source depth images.
+        chunk_size: int, default=262144
+            Maximum number of pixels processed at once. Rounded down to whole image rows.
+        """
+        assert chunk_size > 0, f'Invalid chunk size: {chunk_size}'
+        self.width = width
+        self.height = height
+        self.chunk_rows = min(max(chunk_size // width, 1), height)
+        self.chunk_size = self.chunk_rows * width
+
+        self.uv = np.empty((2, width * height), dtype=np.float32)
+        self.valid = np.empty(width * height, dtype=bool)
+        self._cam1 = np.empty((3, self.chunk_size), dtype=np.float64)
+        self._cam2 = np.empty((3, self.chunk_size), dtype=np.float64)
+
+    def reproject(self, depth1, pose1, pose2, K1, K2, scale=1, target_size=None):
+        """ Find pixel coordinates in the target view of every pixel of the source depth image.
+
+        Parameters
+        ----------
+        depth1: numpy array
+            Depth image of the source view of shape (height, width).
+        pose1: tuple
+            World to camera (tcw, Rcw) of the source view with shapes (3,1) and (3,3), e.g. from
+            *PoseStore.get_tR*.
+        pose2: tuple
+            World to camera (tcw, Rcw) of the target view.
+        K1: dict or numpy array
+            Intrinsics of the source view. See *intrinsics_to_arrays*.
+        K2: dict or numpy array
+            Intrinsics of the target view.
+        scale: int or float, default=1
+            Value multiplied with translations to get depth units.
+        target_size: tuple or None, default=None
+            (width, height) of the target image. Same as the source when None.
+
+        Returns
+        -------
+        uv: numpy array
+            Float32 array of shape (2, height*width) with target x and y pixel coordinates of each
+            source pixel in row major order. Invalid pixels have undefined values.
+        valid: numpy array
+            Boolean array of shape (height*width,) of source pixels with non-zero depth that land
+            in front of the target camera and inside the target image.
+        """
+        depth_flat = np.asarray(depth1).reshape(-1)
+        assert len(depth_flat) == self.width * self.height, \
+            f'Depth size {depth1.shape} does not match reprojector {self.height}x{self.width}.'
+        target_w, target_h = (self.width, self.height) if target_size is None else target_size
+
+        fx1, fy1, cx1, cy1 = [i[0] for i in intrinsics_to_arrays(K1, 1)]
+        fx2, fy2, cx2, cy2 = [i[0] for i in intrinsics_to_arrays(K2, 1)]
+        ray_grid = get_ray_grid(self.width, self.height, fx=fx1, fy=fy1, cx=cx1, cy=cy1)
+
+        # Camera-1 to Camera-2 transformation
+        tc1w, Rc1w = pose1
+        tc2w, Rc2w = pose2
+        twc1, Rwc1 = camera_to_world_tR(np.reshape(tc1w, (3, 1)) * scale, Rc1w)
+        tc2c1, Rc2c1 = inter_camera_tR(twc1, Rwc1, np.reshape(tc2w, (3, 1)) * scale, Rc2w)
+
+        for row in range(0, self.height, self.chunk_rows):
+            row_end = min(row + self.chunk_rows, self.height)
+            start, end = row * self.width, row_end * self.width
+            n = end - start
+            cam1 = self._cam1[:, :n]
+            cam2 = self._cam2[:, :n]
+            u = self.uv[0, start:end]
+            v = self.uv[1, start:end]
+            valid = self.valid[start:end]
+            z1 = depth_flat[start:end]
+
+            # Back-project rows of the chunk with the column and row factors of the rays
+            z1_rows = z1.reshape(-1, self.width)
+            np.multiply(z1_rows, ray_grid.x_rays[None, :], out=cam1[0].reshape(-1, self.width))
+            np.multiply(z1_rows, ray_grid.y_rays[row:row_end, None],
+                        out=cam1[1].reshape(-1, self.width))
+            cam1[2] = z1
+            np.matmul(Rc2c1, cam1, out=cam2)
+            cam2 += tc2c1
+
+            # Project to target image, reusing cam1 rows as scratch space
+            z2 = cam2[2]
+            np.greater(z2, 0, out=valid)
+            valid &= z1 != 0
+            np.divide(cam2[0], z2, out=cam1[0], where=valid)
+            np.divide(cam2[1], z2, out=cam1[1], where=valid)
+            cam1[0] *= fx2
+            cam1[0] += cx2
+            cam1[1] *= fy2
+            cam1[1] += cy2
+            valid &= cam1[0] >= 0
+            valid &= cam1[0] <= target_w - 1
+            valid &= cam1[1] >= 0
+            valid &= cam1[1] <= target_h - 1
+            u[:] = cam1[0]
+            v[:] = cam1[1]
+
+        return self.uv, self.valid
+
+
+def reproject(depth1, pose1, pose2, K1, K2, scale=1, target_size=None, chunk_size=2 ** 18):
+    """ Find pixel coordinates in the target view of every pixel of the source depth image.
+
+        Convenience wrapper around *Reprojector.reproject*. Create a *Reprojector* once to reuse
+    its buffers over many pairs.
+
+    Returns
+    -------
+    uv: numpy array
+        Float32 array of shape (2, height*width) with target pixel coordinates.
+    valid: numpy array
+        Boolean array of shape (height*width,) of valid reprojections.
+    """
+    imh, imw = np.shape(depth1)
+    reprojector = Reprojector(imw, imh, chunk_size=chunk_size)
+    return reprojector.reproject(depth1, pose1, pose2, K1, K2, scale=scale,
+                                 target_size=target_size)
@@ -0,0 +1,291 @@
+import warnings
+from collections.abc import Mapping
+import numpy as np
+
+from activevision.defaults import ALL_DIRECTIONS
+from activevision.utils.cache_utils import save_arrays, load_arrays
+
+BOX_COLUMNS = 6  # x1, y1, x2, y2, instance_id, difficulty
+
+
+def gather_segments(values, offsets, indices):
+    """ Gather and concatenate segments of a flat array.
+
+    Parameters
+    ----------
+    values: numpy array
+        Flat array of shape (total, ...) holding all segments.
+    offsets: numpy array
+        Array of shape (num_segments+1,) such that segment i is values[offsets[i]:offsets[i+1]].
+    indices: list or numpy array
+        Indices of the segments to gather.
+
+    Returns
+    -------
+    gathered: numpy array
+        Selected segments concatenated in order of `indices`.
+    gathered_offsets: numpy array
+        Offsets of each selected segment in `gathered`.
+    """
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+    starts = offsets[indices]
+    counts = offsets[indices + 1] - starts
+
+    gathered_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(counts, out=gathered_offsets[1:])
+    rows = np.repeat(starts - gathered_offsets[:-1], counts) + np.arange(gathered_offsets[-1])
+
+    return values[rows], gathered_offsets
+
+
+def segment_pairs(offsets, other_starts, other_counts):
+    """ Enumerate all pairs of rows of two segmented arrays that belong to the same segment.
+
+    Parameters
+    ----------
+    offsets: numpy array
+        Array of shape (num_segments+1,) of the first flat array. See *gather_segments*.
+    other_starts: numpy array
+        Array of shape (num_segments,) with the first row of each segment in the other array.
+    other_counts: numpy array
+        Array of shape (num_segments,) with the number of rows of each segment in the other array.
+
+    Returns
+    -------
+    rows: numpy array
+        Rows of the first array of each pair, sorted.
+    other_rows: numpy array
+        Rows of the other array of each pair.
+    """
+    segment_of_row = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    counts = np.asarray(other_counts, dtype=np.int64)[segment_of_row]
+
+    pair_offsets = np.cumsum(counts) - counts
+    within = np.arange(counts.sum()) - np.repeat(pair_offsets, counts)
+    rows = np.repeat(np.arange(len(segment_of_row)), counts)
+    other_starts = np.asarray(other_starts, dtype=np.int64)[segment_of_row]
+    other_rows = np.repeat(other_starts, counts) + within
+
+    return rows, other_rows
+
+
+class SceneAnnotations(Mapping):
+    """ Columnar annotations of a single scene.
+
+        Stores the contents of a scene's annotations.json as flat arrays instead of nested dicts:
+
+        - image_names: (N,) image names in the order of the annotations file
+        - neighbors: (N, 6) int32 index of the neighbor image for each direction in
+          *ALL_DIRECTIONS*, -1 when there is no neighbor
+        - boxes: (total_boxes, 6) int32 rows of [x1, y1, x2, y2, instance_id, difficulty]
+        - box_offsets: (N+1,) int64 such that boxes of image i are
+          boxes[box_offsets[i]:box_offsets[i+1]]
+
+        The arrays can be memory mapped from a compiled cache. Indexing with an image name returns
+        a dict in the same format as the annotations file for backward compatibility.
+    """
+
+    def __init__(self, image_names, neighbors, boxes, box_offsets):
+        assert len(neighbors) == len(image_names) and len(box_offsets) == len(image_names) + 1, \
+            'Number of images mismatch between image names, neighbors and box offsets.'
+        self.image_names = image_names
+        self.neighbors = neighbors
+        self.boxes = boxes
+        self.box_offsets = box_offsets
+        self.name2idx = {name: idx for idx, name in enumerate(image_names.tolist())}
+
+    @classmethod
+    def from_json(cls, annotations, scene=None):
+        """ Create from the dict loaded from a scene's annotations.json file.
+
+            Neighbors that are not annotated images of the scene are stored as -1, i.e. no
+        neighbor, with a warning.
+
+        Parameters
+        ----------
+        annotations: dict
+            Mapping from image name to its annotations.
+        scene: str or None, default=None
+            Name of the scene, only used in warnings.
+
+        Returns
+        -------
+        SceneAnnotations
+        """
+        names = list(annotations.keys())
+        name2idx = {name: idx for idx, name in enumerate(names)}
+        name2idx[''] = -1
+
+        neighbors = np.empty((len(names), len(ALL_DIRECTIONS)), dtype=np.int32)
+        num_boxes = np.zeros(len(names) + 1, dtype=np.int64)
+        all_boxes = []
+        unknown = []  # (image name, direction, neighbor) of neighbors that are not annotated
+        for idx, name in enumerate(names):
+            img_ann = annotations[name]
+            for dir_idx, direction in enumerate(ALL_DIRECTIONS):
+                neighbor = img_ann[direction]
+                if neighbor not in name2idx:
+                    unknown.append((name, direction, neighbor))
+                neighbors[idx, dir_idx] = name2idx.get(neighbor, -1)
+            num_boxes[idx + 1] = len(img_ann['bounding_boxes'])
+            all_boxes.extend(img_ann['bounding_boxes'])
+
+        if len(unknown) > 0:
+            name, direction, neighbor = unknown[0]
+            warnings.warn(f'{len(unknown)} neighbors of **{scene}** are not annotated images and '
+                          f'are treated as missing, e.g. {neighbor} of {name} in direction '
+                          f'{direction}.')
+
+        boxes = np.array(all_boxes, dtype=np.int32).reshape(-1, BOX_COLUMNS)
+        image_names = np.array(names, dtype=str) if len(names) > 0 else np.empty(0, dtype='<U1')
+
+        return cls(image_names=image_names, neighbors=neighbors, boxes=boxes,
+                   box_offsets=np.cumsum(num_boxes))
+
+    @classmethod
+    def load(cls, cache_dir, mmap_mode='r'):
+        arrays = load_arrays(cache_dir, mmap_mode=mmap_mode)
+        return cls(image_names=arrays['image_names'], neighbors=arrays['neighbors'],
+                   boxes=arrays['boxes'], box_offsets=arrays['box_offsets'])
+
+    def save(self, cache_dir, sources, version):
+        save_arrays(cache_dir, {'image_names': self.image_names, 'neighbors': self.neighbors,
+                                'boxes': self.boxes, 'box_offsets': self.box_offsets},
+                    sources=sources, version=version)
+
+    @property
+    def nbytes(self):
+        return self.image_names.nbytes + self.neighbors.nbytes + self.boxes.nbytes + \
+               self.box_offsets.nbytes
+
+    def image_boxes(self, idx):
+        """ Get (num_boxes, 6) view of the boxes of image at index `idx`. """
+        return self.boxes[self.box_offsets[idx]:self.box_offsets[idx + 1]]
+
+    def image_boxes_batch(self, indices):
+        """ Get boxes of many images in a single gather.
+
+        Parameters
+        ----------
+        indices: list or numpy array
+            Indices of the images.
+
+        Returns
+        -------
+        boxes: numpy array
+            Array of shape (num_boxes, 6) with boxes of all images concatenated in input order.
+        offsets: numpy array
+            Array of shape (len(indices)+1,) such that boxes of the i-th input image are
+            boxes[offsets[i]:offsets[i+1]].
+        """
+        return gather_segments(self.boxes, self.box_offsets, indices)
+
+    def __getitem__(self, img_name):
+        idx = self.name2idx[img_name]
+        img_ann = {'bounding_boxes': self.image_boxes(idx).tolist()}
+        for dir_idx, direction in enumerate(ALL_DIRECTIONS):
+            neighbor_idx = self.neighbors[idx, dir_idx]
+            img_ann[direction] = str(self.image_names[neighbor_idx]) if neighbor_idx >= 0 else ''
+        return img_ann
+
+    def __iter__(self):
+        return iter(self.name2idx)
+
+    def __len__(self):
+        return len(self.image_names)
+
+    def __contains__(self, img_name):
+        return img_name in self.name2idx
+
+
+class SceneCategoryBoxes(Mapping):
+    """ Packed category bounding boxes of a single scene.
+
+        Stores the category boxes of all images of a scene as flat arrays:
+
+        - image_names: (N,) names (with .jpg) of images that have a category annotation file
+        - boxes: (total_boxes, 4) int32 rows of [x1, y1, x2, y2]
+        - category_ids: (total_boxes,) int32 category id of each box
+        - box_offsets: (N+1,) int64 such that boxes of image i are
+          boxes[box_offsets[i]:box_offsets[i+1]]
+        - table_ids, table_names: (K,) category id to name table of the scene
+
+        Indexing with an image name returns the list of [x1, y1, x2, y2, category_id] boxes as
+        previously loaded from the image's annotation file.
+    """
+
+    def __init__(self, image_names, boxes, category_ids, box_offsets, table_ids, table_names):
+        assert len(box_offsets) == len(image_names) + 1, \
+            'Number of images mismatch between image names and box offsets.'
+        self.image_names = image_names
+        self.boxes = boxes
+        self.category_ids = category_ids
+        self.box_offsets = box_offsets
+        self.table_ids = table_ids
+        self.table_names = table_names
+        self.name2idx = {name: idx for idx, name in enumerate(image_names.tolist())}
+
+    @classmethod
+    def from_lists(cls, image_names, image_boxes, category_id2name_map):
+        """ Create from per image lists of [x1, y1, x2, y2, category_id] boxes.
+
+        Parameters
+        ----------
+        image_names: list
+            Names of the images.
+        image_boxes: list
+            List of boxes for each image in `image_names`.
+        category_id2name_map: dict
+            Mapping from category id to its name.
+
+        Returns
+        -------
+        SceneCategoryBoxes
+        """
+        num_boxes = np.zeros(len(image_names) + 1, dtype=np.int64)
+        num_boxes[1:] = [len(i) for i in image_boxes]
+        all_boxes = np.array([box for boxes in image_boxes for box in boxes],
+                             dtype=np.int32).reshape(-1, 5)
+        table_ids = sorted(category_id2name_map.keys())
+
+        return cls(image_names=np.array(image_names, dtype=str).reshape(-1),
+                   boxes=all_boxes[:, :4], category_ids=all_boxes[:, 4],
+                   box_offsets=np.cumsum(num_boxes),
+                   table_ids=np.array(table_ids, dtype=np.int32),
+                   table_names=np.array([category_id2name_map[i] for i in table_ids],
+                                        dtype=str).reshape(-1))
+
+    @classmethod
+    def load(cls, cache_dir, mmap_mode='r'):
+        arrays = load_arrays(cache_dir, mmap_mode=mmap_mode)
+        return cls(**arrays)
+
+    def save(self, cache_dir, sources, version):
+        save_arrays(cache_dir, {'image_names': self.image_names, 'boxes': self.boxes,
+                                'category_ids': self.category_ids,
+                                'box_offsets': self.box_offsets, 'table_ids': self.table_ids,
+                                'table_names': self.table_names},
+                    sources=sources, version=version)
+
+    @property
+    def category_id2name_map(self):
+        return dict(zip(self.table_ids.tolist(), self.table_names.tolist()))
+
+    @property
+    def nbytes(self):
+        return self.image_names.nbytes + self.boxes.nbytes + self.category_ids.nbytes + \
+               self.box_offsets.nbytes + self.table_ids.nbytes + self.table_names.nbytes
+
+    def __getitem__(self, img_name):
+        idx = self.name2idx[img_name]
+        start, end = self.box_offsets[idx], self.box_offsets[idx + 1]
+        return np.column_stack((self.boxes[start:end], self.category_ids[start:end])).tolist()
+
+    def __iter__(self):
+        return iter(self.name2idx)
+
+    def __len__(self):
+        return len(self.image_names)
+
+    def __contains__(self, img_name):
+        return img_name in self.name2idx
@@ -0,0 +1,246 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
+
+from activevision.scene_annotations import gather_segments
+
+UNREACHABLE = np.iinfo(np.uint16).max
+
+
+def reverse_adjacency(transitions):
+    """ Get predecessors of every image of a navigation graph in CSR format.
+
+    Parameters
+    ----------
+    transitions: numpy array
+        Transition table of shape (num_images, num_actions) with -1 for impossible moves.
+
+    Returns
+    -------
+    indptr: numpy array
+        Array of shape (num_images+1,) such that predecessors of image j are
+        indices[indptr[j]:indptr[j+1]].
+    indices: numpy array
+        Concatenated predecessors of all images.
+    """
+    num_images = len(transitions)
+    src, action = np.nonzero(transitions >= 0)
+    dst = transitions[src, action]
+
+    order = np.argsort(dst, kind='stable')
+    indptr = np.zeros(num_images + 1, dtype=np.int64)
+    np.cumsum(np.bincount(dst, minlength=num_images), out=indptr[1:])
+    return indptr, src[order]
+
+
+def multi_source_distances(reverse_adj, sources, num_images):
+    """ Get number of moves from every image to the nearest source image.
+
+        Runs a breadth first search from all sources at once on the reversed graph, expanding a
+    whole frontier per iteration.
+
+    Parameters
+    ----------
+    reverse_adj: tuple
+        Predecessors of every image as returned by *reverse_adjacency*.
+    sources: list or numpy array
+        Indices of the target images.
+    num_images: int
+        Number of images in the graph.
+
+    Returns
+    -------
+    numpy array
+        Array of shape (num_images,) of dtype uint16 with *UNREACHABLE* for images from which no
+        source can be reached.
+    """
+    indptr, indices = reverse_adj
+    distances = np.full(num_images, UNREACHABLE, dtype=np.uint16)
+
+    frontier = np.unique(np.asarray(sources, dtype=np.int64))
+    distance = 0
+    while len(frontier) > 0:
+        assert distance < UNREACHABLE, 'Path length exceeds range of uint16.'
+        distances[frontier] = distance
+        predecessors, _ = gather_segments(indices, indptr, frontier)
+        predecessors = np.unique(predecessors)
+        frontier = predecessors[distances[predecessors] == UNREACHABLE]
+        distance += 1
+
+    return distances
+
+
+def all_pairs_distances(transitions, chunk_size=512):
+    """ Get number of moves between every pair of images of a navigation graph.
+
+    Parameters
+    ----------
+    transitions: numpy array
+        Transition table of shape (num_images, num_actions) with -1 for impossible moves.
+    chunk_size: int, default=512
+        Number of source images solved at once. Bounds the temporary float64 memory to
+        chunk_size * num_images.
+
+    Returns
+    -------
+    numpy array
+        Array of shape (num_images, num_images) of dtype uint16 where [i, j] is the number of
+        moves from image i to image j and *UNREACHABLE* if there is no path.
+    """
+    num_images = len(transitions)
+    src, action = np.nonzero(transitions >= 0)
+    graph = csr_matrix((np.ones(len(src)), (src, transitions[src, action])),
+                       shape=(num_images, num_images))
+
+    distances = np.empty((num_images, num_images), dtype=np.uint16)
+    for start in range(0, num_images, chunk_size):
+        rows = np.arange(start, min(start + chunk_size, num_images))
+        chunk = shortest_path(graph, directed=True, unweighted=True, indices=rows)
+        chunk[np.isinf(chunk)] = UNREACHABLE
+        distances[rows] = chunk
+    return distances
+
+
+class ShortestPathEngine:
+    """ Shortest paths to instances over the navigation graphs of loaded scenes.
+
+        Distances are the number of moves from every image of a scene to the nearest image whose
+    bounding boxes contain a given instance. Results are cached per scene, instance and difficulty
+    threshold.
+    """
+
+    def __init__(self, annotations):
+        """
+        Parameters
+        ----------
+        annotations: AVDAnnotations
+            Annotations with the scenes to compute distances for loaded.
+        """
+        self.annotations = annotations
+        self._reverse_adj = dict()
+        self._distances = dict()
+        self._all_pairs = dict()
+
+    def _get_reverse_adj(self, scene):
+        if scene not in self._reverse_adj:
+            graph = self.annotations.get_navigation_graph(scene)
+            self._reverse_adj[scene] = reverse_adjacency(graph.transitions)
+        return self._reverse_adj[scene]
+
+    def instance_images(self, scene, max_difficulty=None):
+        """ Get indices of images containing each instance of a scene.
+
+        Parameters
+        ----------
+        scene: str
+            Name of the scene.
+        max_difficulty: int or None, default=None
+            Only consider boxes with difficulty less than or equal to this value. All boxes are
+            considered when None.
+
+        Returns
+        -------
+        dict
+            Mapping from instance id to sorted array of image indices.
+        """
+        scene_ann = self.annotations.annotations[scene]
+        box_image_idx = np.repeat(np.arange(len(scene_ann)), np.diff(scene_ann.box_offsets))
+        instance_ids = np.asarray(scene_ann.boxes[:, 4])
+
+        if max_difficulty is not None:
+            keep = scene_ann.boxes[:, 5] <= max_difficulty
+            box_image_idx = box_image_idx[keep]
+            instance_ids = instance_ids[keep]
+
+        # Sort boxes by instance and then by image to split them into groups per instance
+        order = np.lexsort((box_image_idx, instance_ids))
+        instance_ids = instance_ids[order]
+        box_image_idx = box_image_idx[order]
+        unique_ids, starts = np.unique(instance_ids, return_index=True)
+        groups = np.split(box_image_idx, starts[1:])
+
+        return {int(i): np.unique(g) for i, g in zip(unique_ids, groups)}
+
+    def distances_to_instance(self, scene, instance_id, max_difficulty=None):
+        """ Get number of moves from every image of a scene to the nearest view of an instance.
+
+        Parameters
+        ----------
+        scene: str
+            Name of the scene.
+        instance_id: int
+            Id of the target instance.
+        max_difficulty: int or None, default=None
+            Only views where the instance box has difficulty less than or equal to this value are
+            targets. See *instance_images*.
+
+        Returns
+        -------
+        numpy array
+            Array of shape (num_images,) of dtype uint16 in the order of the scene's images. All
+            values are *UNREACHABLE* if the instance is not visible in the scene.
+        """
+        key = (scene, instance_id, max_difficulty)
+        if key not in self._distances:
+            targets = self.instance_images(scene, max_difficulty=max_difficulty).get(
+                instance_id, np.empty(0, dtype=np.int64))
+            self._distances[key] = multi_source_distances(
+                self._get_reverse_adj(scene), targets,
+                num_images=len(self.annotations.annotations[scene]))
+        return self._distances[key]
+
+    def all_instance_distances(self, scene, max_difficulty=None):
+        """ Get distances to every instance visible in a scene.
+
+        Parameters
+        ----------
+        scene: str
+            Name of the scene.
+        max_difficulty: int or None, default=None
+            See *distances_to_instance*.
+
+        Returns
+        -------
+        instance_ids: numpy array
+            Array of shape (num_instances,) with ids of the instances in the scene.
+        distances: numpy array
+            Array of shape (num_instances, num_images) of dtype uint16 with distances to each
+            instance.
+        """
+        reverse_adj = self._get_reverse_adj(scene)
+        num_images = len(self.annotations.annotations[scene])
+        instance_images = self.instance_images(scene, max_difficulty=max_difficulty)
+
+        instance_ids = np.array(sorted(instance_images), dtype=np.int64)
+        distances = np.empty((len(instance_ids), num_images), dtype=np.uint16)
+        for row, instance_id in enumerate(instance_ids.tolist()):
+            key = (scene, instance_id, max_difficulty)
+            if key not in self._distances:
+                self._distances[key] = multi_source_distances(
+                    reverse_adj, instance_images[instance_id], num_images=num_images)
+            distances[row] = self._distances[key]
+
+        return instance_ids, distances
+
+    def all_pairs(self, scene, chunk_size=512):
+        """ Get cached number of moves between every pair of images of a scene.
+
+            See *all_pairs_distances*.
+        """
+        if scene not in self._all_pairs:
+            graph = self.annotations.get_navigation_graph(scene)
+            self._all_pairs[scene] = all_pairs_distances(graph.transitions, chunk_size=chunk_size)
+        return self._all_pairs[scene]
+
+    def clear(self, scene=None):
+        """ Clear cached results of a scene or of all scenes when None. """
+        if scene is None:
+            self._reverse_adj.clear()
+            self._distances.clear()
+            self._all_pairs.clear()
+            return
+
+        self._reverse_adj.pop(scene, None)
+        self._all_pairs.pop(scene, None)
+        for key in [i for i in self._distances if i[0] == scene]:
+            del self._distances[key]
@@ -26,9 +26,10 @@ def camera_to_world_tR(tcw, Rcw):
         Xw = Rcw Xc + Tcw
         --> (Rcw)-1 Xw = Xc + (Rcw)-1 Tcw
         --> Xc = [(Rcw)-1] Xw  + [-(Rcw)-1 Tcw]
+        The inverse of a rotation matrix is its transpose.
     """
 
-    Rwc = np.linalg.inv(Rcw)
+    Rwc = Rcw.T
     twc = -np.dot(Rwc, tcw)
 
     return twc, Rwc
@@ -63,3 +64,82 @@ def inter_camera_tR(twc1, Rwc1, tc2w, Rc2w):
     tc2c1 = np.matmul(Rc2w, twc1) + tc2w
 
     return tc2c1, Rc2c1
+
+
+def camera_to_world_tR_batch(tcw, Rcw):
+    """ Batched version of *camera_to_world_tR*.
+
+    Parameters
+    ----------
+    tcw: numpy array
+        Translation parameters of shape (B,3,1).
+    Rcw: numpy array
+        Rotation parameters of shape (B,3,3).
+
+    Returns
+    -------
+    twc: numpy array of shape (B,3,1)
+    Rwc: numpy array of shape (B,3,3)
+    """
+    Rwc = np.swapaxes(Rcw, -1, -2)
+    twc = -np.einsum('bij,bjk->bik', Rwc, tcw)
+
+    return twc, Rwc
+
+
+def inter_camera_tR_batch(twc1, Rwc1, tc2w, Rc2w):
+    """ Batched version of *inter_camera_tR*.
+
+    Parameters
+    ----------
+    twc1: numpy array of shape (B,3,1)
+    Rwc1: numpy array of shape (B,3,3)
+    tc2w: numpy array of shape (B,3,1)
+    Rc2w: numpy array of shape (B,3,3)
+
+    Returns
+    -------
+    tc2c1: numpy array of shape (B,3,1)
+    Rc2c1: numpy array of shape (B,3,3)
+    """
+    Rc2c1 = np.einsum('bij,bjk->bik', Rc2w, Rwc1)
+    tc2c1 = np.einsum('bij,bjk->bik', Rc2w, twc1) + tc2w
+
+    return tc2c1, Rc2c1
+
+
+def relative_tR_pairs(t, R, src_rows, tgt_rows, scale=1):
+    """ Find Camera-1 to Camera-2 parameters for many pairs of rows of a pose table.
+
+        Fuses *camera_to_world_tR* and *inter_camera_tR* for each (source, target) pair:
+        Rc2c1 = Rc2w Rc1w^T and tc2c1 = tc2w - Rc2c1 tc1w
+
+    Parameters
+    ----------
+    t: numpy array
+        World to camera translations of shape (N,3) or (N,3,1), e.g. *PoseStore.t*.
+    R: numpy array
+        World to camera rotations of shape (N,3,3), e.g. *PoseStore.R*.
+    src_rows: numpy array
+        Rows of Camera-1 of each pair of shape (B,).
+    tgt_rows: numpy array
+        Rows of Camera-2 of each pair of shape (B,).
+    scale: int or float, default=1
+        Value multiplied with translations, e.g. scale of the scene.
+
+    Returns
+    -------
+    tc2c1: numpy array of shape (B,3,1)
+        Translation parameters of Camera-1 to Camera-2 coordinate.
+    Rc2c1: numpy array of shape (B,3,3)
+        Rotation parameters of Camera-1 to Camera-2 coordinate.
+    """
+    t = np.asarray(t).reshape(len(t), 3)
+    tc1w = t[src_rows] * scale
+    tc2w = t[tgt_rows] * scale
+    Rc2w = R[tgt_rows]
+
+    Rc2c1 = np.einsum('bij,bkj->bik', Rc2w, R[src_rows])
+    tc2c1 = tc2w - np.einsum('bij,bj->bi', Rc2c1, tc1w)
+
+    return tc2c1[..., None], Rc2c1
@@ -0,0 +1,108 @@
+import numpy as np
+
+# Boxes are float arrays of shape (N,4). Pairwise functions return (N,M) arrays for every
+# combination of two sets of boxes and paired functions return (N,) arrays for row aligned sets.
+
+
+def _as_boxes(boxes):
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def box_areas(boxes):
+    """ Get areas of (N,4) [x1, y1, x2, y2] boxes. Inverted boxes have zero area. """
+    boxes = _as_boxes(boxes)
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def _intersection(boxes1, boxes2):
+    # Broadcasts over leading axes of both inputs
+    inter_w = np.minimum(boxes1[..., 2], boxes2[..., 2]) - \
+        np.maximum(boxes1[..., 0], boxes2[..., 0])
+    inter_h = np.minimum(boxes1[..., 3], boxes2[..., 3]) - \
+        np.maximum(boxes1[..., 1], boxes2[..., 1])
+    return np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+
+
+def _safe_divide(numerator, denominator):
+    ratio = np.zeros_like(numerator)
+    np.divide(numerator, denominator, out=ratio, where=denominator > 0)
+    return ratio
+
+
+def pairwise_intersection(boxes1, boxes2):
+    """ Get intersection area of every pair of (N,4) and (M,4) [x1, y1, x2, y2] boxes as (N,M). """
+    return _intersection(_as_boxes(boxes1)[:, None], _as_boxes(boxes2)[None, :])
+
+
+def pairwise_iou(boxes1, boxes2):
+    """ Get intersection over union of every pair of boxes.
+
+    Parameters
+    ----------
+    boxes1: numpy array
+        Boxes of shape (N,4) in [x1, y1, x2, y2] format.
+    boxes2: numpy array
+        Boxes of shape (M,4) in [x1, y1, x2, y2] format.
+
+    Returns
+    -------
+    numpy array
+        Array of shape (N,M) where [i, j] is the IoU of boxes1[i] and boxes2[j]. Pairs with zero
+        union, e.g. involving NaN boxes, have zero IoU.
+    """
+    inter = pairwise_intersection(boxes1, boxes2)
+    union = box_areas(boxes1)[:, None] + box_areas(boxes2)[None, :] - inter
+    return _safe_divide(inter, union)
+
+
+def pairwise_containment(inner, outer):
+    """ Get fraction of the area of each inner box inside each outer box as (N,M).
+
+        A value of 1 means inner[i] lies completely inside outer[j]. Boxes with zero area have
+    zero containment.
+    """
+    return _safe_divide(pairwise_intersection(inner, outer), box_areas(inner)[:, None])
+
+
+def paired_intersection(boxes1, boxes2):
+    """ Get intersection area of row aligned (N,4) boxes as (N,). """
+    return _intersection(_as_boxes(boxes1), _as_boxes(boxes2))
+
+
+def paired_iou(boxes1, boxes2):
+    """ Get IoU of row aligned (N,4) boxes as (N,). See *pairwise_iou*. """
+    inter = paired_intersection(boxes1, boxes2)
+    return _safe_divide(inter, box_areas(boxes1) + box_areas(boxes2) - inter)
+
+
+def paired_containment(inner, outer):
+    """ Get fraction of the area of each inner box inside its row aligned outer box as (N,). """
+    return _safe_divide(paired_intersection(inner, outer), box_areas(inner))
+
+
+def clip_boxes(boxes, width, height):
+    """ Clip (N,4) [x1, y1, x2, y2] boxes to the pixels of an image of size (width, height).
+
+    Returns
+    -------
+    numpy array
+        Float64 clipped boxes with x in [0, width-1] and y in [0, height-1].
+    """
+    boxes = _as_boxes(boxes).copy()
+    np.clip(boxes[:, 0::2], 0, width - 1, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, height - 1, out=boxes[:, 1::2])
+    return boxes
+
+
+def xyxy_to_xywh(boxes):
+    """ Convert (N,4) [x1, y1, x2, y2] boxes to [x1, y1, width, height] as used by matplotlib. """
+    boxes = np.array(boxes).reshape(-1, 4)
+    boxes[:, 2:] -= boxes[:, :2]
+    return boxes
+
+
+def xywh_to_xyxy(boxes):
+    """ Convert (N,4) [x1, y1, width, height] boxes to [x1, y1, x2, y2]. """
+    boxes = np.array(boxes).reshape(-1, 4)
+    boxes[:, 2:] += boxes[:, :2]
+    return boxes
@@ -0,0 +1,188 @@
+import os
+import json
+import numpy as np
+
+from activevision.defaults import CACHE_FOLDER, CACHE_META_FNAME
+
+
+def get_cache_dir(data_root, scene, name, cache_root=None):
+    """ Get directory where a compiled cache of a scene is stored.
+
+    Parameters
+    ----------
+    data_root: str
+        Root of the Active Vision Dataset.
+    scene: str
+        Name of the scene.
+    name: str
+        Name of the cache, for example 'annotations'.
+    cache_root: str or None, default=None
+        Root folder for all caches. Uses *CACHE_FOLDER* inside `data_root` when None.
+
+    Returns
+    -------
+    str
+        Path of the cache directory. It is not created by this function.
+    """
+    if cache_root is None:
+        cache_root = os.path.join(data_root, CACHE_FOLDER)
+    return os.path.join(cache_root, scene, name)
+
+
+def source_signature(paths):
+    """ Get modification time and size of source files used to build a cache.
+
+    Parameters
+    ----------
+    paths: list
+        List of file or directory paths.
+
+    Returns
+    -------
+    list
+        List of [path basename, mtime in ns, size in bytes] for each path. Missing paths have
+        mtime and size of -1.
+    """
+    signature = []
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append([os.path.basename(path), stat.st_mtime_ns, stat.st_size])
+        else:
+            signature.append([os.path.basename(path), -1, -1])
+    return signature
+
+
+def directory_sources(path, suffix=None):
+    """ Get a directory and its files as sources of a cache.
+
+        Modification time of a directory only changes when files are added, removed or renamed,
+    so the files are also listed to detect files that are edited or replaced in place.
+
+    Parameters
+    ----------
+    path: str
+        Path of the directory.
+    suffix: str or None, default=None
+        Only list files ending with the suffix, e.g. '.png'. Lists all files when None.
+
+    Returns
+    -------
+    list
+        Path of the directory followed by the sorted paths of its files. Only the directory if it
+        does not exist.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    names = sorted(i for i in os.listdir(path) if suffix is None or i.endswith(suffix))
+    return [path] + [os.path.join(path, i) for i in names]
+
+
+def read_cache_meta(cache_dir):
+    meta_path = os.path.join(cache_dir, CACHE_META_FNAME)
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path, 'r') as f:
+        return json.load(f)
+
+
+def is_cache_valid(cache_dir, sources, version):
+    """ Check if cache exists and was built from the current version of its sources.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Directory of the cache.
+    sources: list
+        Paths of the source files the cache was built from.
+    version: int
+        Version of the cache format. Caches with a different version are stale.
+
+    Returns
+    -------
+    bool
+    """
+    meta = read_cache_meta(cache_dir)
+    if meta is None:
+        return False
+    return meta.get('version') == version and meta.get('sources') == source_signature(sources)
+
+
+def invalidate_cache(cache_dir):
+    """ Remove the meta file of a cache so it is considered stale while it is being rewritten.
+
+        Creates the cache directory if it does not exist.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, CACHE_META_FNAME)
+    if os.path.isfile(meta_path):
+        os.remove(meta_path)
+
+
+def write_cache_meta(cache_dir, array_names, sources, version, extra_meta=None):
+    """ Write the meta file that marks the arrays of a cache as complete and valid.
+
+        See *save_arrays* for the parameters. Use together with *invalidate_cache* for arrays that
+    are written directly into the cache directory, e.g. with *np.lib.format.open_memmap*.
+    """
+    meta = {'version': version, 'sources': source_signature(sources),
+            'arrays': sorted(array_names)}
+    if extra_meta is not None:
+        meta.update(extra_meta)
+    with open(os.path.join(cache_dir, CACHE_META_FNAME), 'w') as f:
+        json.dump(meta, f)
+
+
+def save_arrays(cache_dir, arrays, sources, version, extra_meta=None):
+    """ Save arrays as individual .npy files along with the signature of their sources.
+
+        The meta file is written last so that a partially written cache is never considered valid.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Directory of the cache. Created if it does not exist.
+    arrays: dict
+        Mapping from array name to numpy array.
+    sources: list
+        Paths of the source files the cache was built from.
+    version: int
+        Version of the cache format.
+    extra_meta: dict or None, default=None
+        Additional json serializable information to store in the meta file.
+
+    Returns
+    -------
+    None
+    """
+    invalidate_cache(cache_dir)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(cache_dir, name + '.npy'), np.ascontiguousarray(array))
+
+    write_cache_meta(cache_dir, arrays.keys(), sources=sources, version=version,
+                     extra_meta=extra_meta)
+
+
+def load_arrays(cache_dir, mmap_mode='r'):
+    """ Load all arrays of a cache.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Directory of the cache.
+    mmap_mode: str or None, default='r'
+        Memory map mode passed to *np.load*. Arrays are read fully into memory when None.
+
+    Returns
+    -------
+    dict
+        Mapping from array name to (memory mapped) numpy array.
+    """
+    meta = read_cache_meta(cache_dir)
+    assert meta is not None, f'No cache found in {cache_dir}'
+
+    arrays = dict()
+    for name in meta['arrays']:
+        arrays[name] = np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode=mmap_mode)
+    return arrays
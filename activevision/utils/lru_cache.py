@@ -0,0 +1,193 @@
+import sys
+import mmap
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def resident_nbytes(array):
+    """ Get bytes of an array held in memory. Memory mapped arrays and their views count as 0. """
+    base = array
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return 0
+        base = getattr(base, 'base', None)
+    return int(array.nbytes)
+
+
+def deep_sizeof(obj):
+    """ Estimate memory held in memory by an object in bytes.
+
+        Counts the buffers of numpy arrays, except memory mapped ones whose pages are owned by the
+    OS page cache (see *resident_nbytes*), and recursively sums the size of containers and of
+    the attributes of objects, e.g. the name to index dict of a *SceneAnnotations*. Shared
+    objects are counted each time they are referenced.
+
+    Parameters
+    ----------
+    obj: object
+
+    Returns
+    -------
+    int
+    """
+    if isinstance(obj, np.ndarray):
+        return resident_nbytes(obj)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k) + deep_sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(i) for i in obj)
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj))
+    elif hasattr(obj, 'nbytes'):
+        size = int(obj.nbytes)
+    return size
+
+
+class LRUCache:
+    """ Least recently used cache with optional item count and memory budgets.
+
+        Items are loaded with `loader` on first access and the least recently used items are
+    evicted when the number of items exceeds `max_items` or their estimated size exceeds
+    `max_bytes`. The most recently added item is never evicted, even if it alone exceeds the
+    budget. Safe to use from multiple threads; loading happens outside the lock so that
+    different keys can be loaded concurrently.
+    """
+
+    def __init__(self, loader=None, max_items=None, max_bytes=None, sizeof=deep_sizeof):
+        """
+        Parameters
+        ----------
+        loader: callable or None, default=None
+            Function that returns the value of a key on a cache miss.
+        max_items: int or None, default=None
+            Maximum number of resident items. Unbounded when None.
+        max_bytes: int or None, default=None
+            Maximum total estimated size of resident items in bytes. Unbounded when None. With the
+            default `sizeof`, memory mapped arrays are not counted.
+        sizeof: callable, default=deep_sizeof
+            Function estimating the size of a value in bytes. Only used with `max_bytes`.
+        """
+        assert max_items is None or max_items > 0, f'Invalid max_items: {max_items}'
+        self.loader = loader
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._items = OrderedDict()
+        self._sizes = dict()
+        self._lock = threading.RLock()
+
+    def __str__(self):
+        return f'LRUCache({len(self)} items, {self.total_bytes} bytes). Stats: {self.stats()}'
+
+    def get(self, key, loader=None):
+        """ Get value of key, loading it on a cache miss.
+
+        Parameters
+        ----------
+        key: hashable
+        loader: callable or None, default=None
+            Loader used instead of the default one of the cache.
+
+        Returns
+        -------
+        Value of the key.
+        """
+        with self._lock:
+            if key in self._items:
+                self.hits += 1
+                self._items.move_to_end(key)
+                return self._items[key]
+            self.misses += 1
+
+        loader = self.loader if loader is None else loader
+        if loader is None:
+            raise KeyError(key)
+        value = loader(key)
+
+        with self._lock:
+            # Keep the value loaded by another thread in the meantime
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+            self._insert(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._insert(key, value)
+
+    def peek(self, key, default=None):
+        """ Get value of a resident key without loading it or updating its recency. """
+        with self._lock:
+            return self._items.get(key, default)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """ Get hit, miss and eviction counters along with current residency.
+
+        Returns
+        -------
+        dict
+            'hits', 'misses', 'evictions', 'hit_rate', 'items', 'bytes'
+        """
+        with self._lock:
+            accesses = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_rate': self.hits / accesses if accesses > 0 else 0.0,
+                    'items': len(self._items), 'bytes': self.total_bytes}
+
+    def _insert(self, key, value):
+        self._items[key] = value
+        self._sizes[key] = self.sizeof(value) if self.max_bytes is not None else 0
+        self.total_bytes += self._sizes[key]
+
+        while len(self._items) > 1 and (
+                (self.max_items is not None and len(self._items) > self.max_items) or
+                (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            self._remove(next(iter(self._items)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        self.total_bytes -= self._sizes.pop(key)
+        return self._items.pop(key)
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._items.keys()))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def keys(self):
+        with self._lock:
+            return list(self._items.keys())
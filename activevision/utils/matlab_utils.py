@@ -37,7 +37,68 @@ def mat_to_dict(mat_file):
     return
 
 
+def _stack_field(values, shape):
+    """ Stack object array of numeric arrays into a float array with NaN for missing entries. """
+    size = int(np.prod(shape))
+    stacked = np.full((len(values),) + shape, np.nan, dtype=np.float64)
+    valid = np.array([v.size == size for v in values], dtype=bool)
+    if valid.any():
+        stacked[valid] = np.stack([v.reshape(shape) for v in values[valid]])
+    return stacked, valid
+
+
+def _int_field(values, missing=-1):
+    return np.array([int(v.flat[0]) if v.size > 0 else missing for v in values], dtype=np.int64)
+
+
+def _str_field(values, missing=''):
+    return np.array([str(v.flat[0]) if v.size > 0 else missing for v in values], dtype=str)
+
+
+def image_struct_to_arrays(image_struct):
+    """ Convert image struct record array to typed contiguous arrays.
+
+        Fields that are not present in the struct are skipped. Missing values are NaN for float
+    arrays, -1 for integer arrays and empty string for string arrays.
+
+    Parameters
+    ----------
+    image_struct: numpy array
+        Record array as returned by *load_image_struct*.
+
+    Returns
+    -------
+    dict
+        'image_name': (N,) str, 't': (N,3), 'R': (N,3,3), 'world_pos': (N,3), 'direction': (N,3),
+        'quat': (N,4), 'scaled_world_pos': (N,3) float64, 'image_id', 'camera_id', 'cluster_id':
+        (N,) int64, neighbor image names such as 'rotate_cw': (N,) str and 'pose_valid': (N,) bool
+        mask of images with both t and R available.
+    """
+    fields = image_struct.dtype.names
+    float_shapes = {'t': (3,), 'R': (3, 3), 'world_pos': (3,), 'direction': (3,), 'quat': (4,),
+                    'scaled_world_pos': (3,)}
+
+    arrays = {'image_name': _str_field(image_struct['image_name'])}
+    pose_valid = np.ones(len(image_struct), dtype=bool)
+    for field in fields:
+        if field in float_shapes:
+            arrays[field], valid = _stack_field(image_struct[field], float_shapes[field])
+            if field in ('t', 'R'):
+                pose_valid &= valid
+        elif field in ('image_id', 'camera_id', 'cluster_id'):
+            arrays[field] = _int_field(image_struct[field])
+        elif field.startswith(('rotate', 'translate')):
+            arrays[field] = _str_field(image_struct[field])
+    arrays['pose_valid'] = pose_valid
+
+    return arrays
+
+
 def get_tR(image_name, image_struct):
+    """ Get world to camera translation and rotation of an image with a linear scan.
+
+        Use *activevision.pose_store.PoseStore* for repeated or batched lookups.
+    """
     for idx, row in enumerate(image_struct):
         row_img_name = row[0][0]
 
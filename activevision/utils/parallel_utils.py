@@ -0,0 +1,34 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def parallel_map(func, items, workers=None, executor='process'):
+    """ Apply function on each item using a pool of workers and return results in input order.
+
+    Parameters
+    ----------
+    func: callable
+        Function applied on each item. Must be picklable, i.e. defined at module level, when using
+        a process pool.
+    items: list
+        Items to apply the function on.
+    workers: int or None, default=None
+        Maximum number of workers. Items are processed sequentially in the calling process when
+        None or less than 2.
+    executor: 'process' or 'thread', default='process'
+        Type of pool. Use processes for CPU bound work such as parsing and threads for I/O bound
+        work or when the results are memory mapped.
+
+    Returns
+    -------
+    list
+        Result of the function for each item in the same order as `items`.
+    """
+    assert executor in ('process', 'thread'), f'Invalid executor {executor}!'
+    items = list(items)
+
+    if workers is None or workers < 2 or len(items) < 2:
+        return [func(item) for item in items]
+
+    pool_cls = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    with pool_cls(max_workers=min(workers, len(items))) as pool:
+        return list(pool.map(func, items))
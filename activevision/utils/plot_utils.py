@@ -1,6 +1,12 @@
+from functools import lru_cache
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib import patches
+from matplotlib.collections import PolyCollection, PathCollection
+from matplotlib.path import Path
+from matplotlib.textpath import TextPath
+from matplotlib.transforms import Affine2D
 from mpl_toolkits.mplot3d import Axes3D
 
 
@@ -30,9 +36,142 @@ from mpl_toolkits.mplot3d import Axes3D
 #   ax.scatter3D(pts[0, :], pts[1, :], pts[2, :])
 #   plt.show()
 
+def stratified_subsample(coordinates, max_points, cell_size=16, seed=0):
+    """ Select `max_points` points keeping the same fraction in every image cell.
+
+        Points are grouped into square cells of `cell_size` pixels and the same fraction of random
+    points is kept from every cell. The budget left over by rounding down goes to random cells,
+    which gives sparse regions a fair chance to remain visible.
+
+    Parameters
+    ----------
+    coordinates: numpy array
+        Points of shape (N,2) in [x, y] format.
+    max_points: int
+        Number of points to keep.
+    cell_size: int, default=16
+        Size of the cells in pixels.
+    seed: int or None, default=0
+        Seed of the random selection.
+
+    Returns
+    -------
+    numpy array
+        Sorted indices of the kept points.
+    """
+    num_points = len(coordinates)
+    if num_points <= max_points:
+        return np.arange(num_points)
+
+    cells = np.floor(np.asarray(coordinates, dtype=float) / cell_size).astype(np.int64)
+    cells -= cells.min(axis=0)
+    cell_ids = cells[:, 1] * (cells[:, 0].max() + 1) + cells[:, 0]
+    _, cell_ids, cell_counts = np.unique(cell_ids, return_inverse=True, return_counts=True)
+
+    # Random rank of every point within its cell
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(num_points)
+    order = order[np.argsort(cell_ids[order], kind='stable')]
+    cell_starts = np.cumsum(cell_counts) - cell_counts
+    ranks = np.empty(num_points, dtype=np.int64)
+    ranks[order] = np.arange(num_points) - np.repeat(cell_starts, cell_counts)
+
+    # Proportional quota of every cell, with the remaining budget given to random cells
+    quota = np.floor(cell_counts * (max_points / num_points)).astype(np.int64)
+    remainder_cells = np.nonzero(cell_counts > quota)[0]
+    num_extra = min(max_points - quota.sum(), len(remainder_cells))
+    quota[rng.choice(remainder_cells, size=num_extra, replace=False)] += 1
+
+    return np.nonzero(ranks < quota[cell_ids])[0]
+
+
+def points_to_layer(coordinates, width, height, overlay='density', color='r', alpha=0.4,
+                    cmap='jet'):
+    """ Rasterize points into an RGBA layer of image resolution.
+
+    Parameters
+    ----------
+    coordinates: numpy array
+        Points of shape (N,2) in [x, y] pixel format. Points outside the image are ignored.
+    width: int
+        Width of the image.
+    height: int
+        Height of the image.
+    overlay: 'density' or 'occupancy', default='density'
+        Color pixels by their log number of points with `cmap`, or pixels with any point with
+        `color`.
+    color: str, default='r'
+        Color of occupied pixels.
+    alpha: float, default=0.4
+        Opacity of pixels with points. Pixels without points are transparent.
+    cmap: str, default='jet'
+        Colormap of the density.
+
+    Returns
+    -------
+    numpy array
+        Float array of shape (height, width, 4).
+    """
+    assert overlay in ('density', 'occupancy'), f'Invalid overlay {overlay}!!!'
+    pixels = np.floor(np.asarray(coordinates, dtype=float) + 0.5).astype(np.int64)
+    inside = (pixels[:, 0] >= 0) & (pixels[:, 0] < width) & \
+        (pixels[:, 1] >= 0) & (pixels[:, 1] < height)
+    pixels = pixels[inside]
+    counts = np.bincount(pixels[:, 1] * width + pixels[:, 0],
+                         minlength=width * height).reshape(height, width)
+
+    layer = np.zeros((height, width, 4))
+    occupied = counts > 0
+    if overlay == 'occupancy':
+        layer[occupied, :3] = matplotlib.colors.to_rgb(color)
+    else:
+        density = np.log1p(counts)
+        density /= max(density.max(), 1e-12)
+        layer[occupied, :3] = matplotlib.colormaps[cmap](density[occupied])[:, :3]
+    layer[occupied, 3] = alpha
+    return layer
+
+
 def scatterplot_in_img(img, coordinates, mode='2n', numbering=False, s=60,
-                       fontsize=20, edgecolor=None, fig=None, ax=None, return_fig=False):
+                       fontsize=20, edgecolor=None, fig=None, ax=None, return_fig=False,
+                       overlay=None, max_points=None, cmap='jet'):
+    """ Plot points on an image.
+
+    Parameters
+    ----------
+    img: PIL Image or numpy array
+        Image to plot the points on. Only drawn when 'fig' and 'ax' are not provided.
+    coordinates: list or numpy array
+        Points with shape (2, N) in mode '2n' or (N, 2) in mode 'n2'.
+    mode: '2n' or 'n2'
+    numbering: bool
+        Flag to write the index of each point next to it.
+    s: int
+        Size of the markers.
+    fontsize: int
+        Font size of the numbers.
+    edgecolor: str or None
+        Edge color of the markers.
+    fig: matplotlib.fig
+    ax: matplotlib.axes
+    return_fig: bool
+        Flag to return fig and axes without showing them.
+    overlay: None, 'density' or 'occupancy'
+        Draw the points as a single rasterized layer of image resolution instead of markers, with
+        constant cost in the number of points. See *points_to_layer*. Ignores numbering. The size
+        of the layer is the size of `img`, or the current limits of `ax` when `img` is None.
+    max_points: int or None
+        Maximum number of points to draw, selected with *stratified_subsample*. Numbers still
+        refer to the index of the point in `coordinates`. All points are drawn when None.
+    cmap: str
+        Colormap of the density overlay.
+
+    Returns
+    -------
+    fig, ax if return_fig else None
+    """
     assert mode in ['2n', 'n2'], f'Invalid mode {mode}!!!'
+    assert overlay in [None, 'density', 'occupancy'], f'Invalid overlay {overlay}!!!'
 
     coordinates = np.array(coordinates)
 
@@ -48,12 +187,23 @@ def scatterplot_in_img(img, coordinates, mode='2n', numbering=False, s=60,
         fig, ax = plt.subplots(figsize=(25, 14))
         ax.imshow(img)
 
-    if numbering:
-        count = 0
-        for x, y in coordinates:
-            ax.scatter(x, y, s=s, color='r', edgecolors=edgecolor)
-            ax.text(x, y, str(count), fontsize=fontsize, color='black')
-            count += 1
+    indices = np.arange(len(coordinates))
+    if max_points is not None:
+        indices = stratified_subsample(coordinates, max_points)
+        coordinates = coordinates[indices]
+
+    if overlay is not None:
+        if img is not None:
+            height, width = np.asarray(img).shape[:2]
+        else:
+            width = int(round(max(ax.get_xlim()) + 0.5))
+            height = int(round(max(ax.get_ylim()) + 0.5))
+        layer = points_to_layer(coordinates, width, height, overlay=overlay, cmap=cmap)
+        ax.imshow(layer, extent=(-0.5, width - 0.5, height - 0.5, -0.5), interpolation='nearest')
+    elif numbering:
+        ax.scatter(coordinates[:, 0], coordinates[:, 1], s=s, color='r', edgecolors=edgecolor)
+        for idx, (x, y) in zip(indices, coordinates):
+            ax.text(x, y, str(idx), fontsize=fontsize, color='black')
     else:
         ax.scatter(coordinates[:, 0], coordinates[:, 1], s=s, color='r',
                    edgecolors=edgecolor, alpha=0.4)
@@ -64,8 +214,131 @@ def scatterplot_in_img(img, coordinates, mode='2n', numbering=False, s=60,
     plt.show()
 
 
+def box_text_params(box_attribs=None, text_attribs=None):
+    """ Get attributes of boxes and labels updated with the specified values.
+
+        See *bboxplot_in_img* for the parameters.
+
+    Returns
+    -------
+    box_p: dict
+        'linewidth' and the 'colors' cycled over boxes.
+    text_p: dict
+        Font attributes of labels.
+    text_box: dict
+        Attributes of the box surrounding labels.
+    """
+    # Default values for text and box attributes
+    box_p = {'linewidth': 2,
+             'colors': ['r', 'g', 'b', 'y', 'brown', 'orange']}
+    text_p = {'fontsize': 8, 'color': 'black'}
+    text_box = {'facecolor': 'wheat', 'alpha': 0.5, 'pad': 0.1, 'boxstyle': 'round'}
+
+    # Update default text and box attributes with specified values
+    if box_attribs is not None:
+        for k, v in box_attribs.items():
+            assert k in box_p, f'Invalid key for box attribute: {k}'
+            box_p[k] = v
+    if text_attribs is not None:
+        for k, v in text_attribs.items():
+            if k != 'box':
+                assert k in text_p, f'Invalid key for text attribute: {k}'
+                text_p[k] = v
+            else:
+                text_box.update(v)
+
+    return box_p, text_p, text_box
+
+
+def box_collection(bboxes, colors, linewidth=2):
+    """ Create a single collection drawing the outlines of many boxes.
+
+    Parameters
+    ----------
+    bboxes: numpy array
+        Boxes of shape (N,4) in [x, y, width, height] format.
+    colors: list
+        Edge colors cycled over the boxes.
+    linewidth: int or float, default=2
+        Width of the box edges.
+
+    Returns
+    -------
+    matplotlib.collections.PolyCollection
+        Closed unfilled rectangles, drawn like *patches.Rectangle* with the same attributes.
+    """
+    bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+    x, y, w, h = bboxes.T
+    verts = np.stack((np.stack((x, y), axis=1), np.stack((x + w, y), axis=1),
+                      np.stack((x + w, y + h), axis=1), np.stack((x, y + h), axis=1)), axis=1)
+    edgecolors = [colors[idx % len(colors)] for idx in range(len(bboxes))]
+    return PolyCollection(verts, closed=True, facecolors='none', edgecolors=edgecolors,
+                          linewidths=linewidth)
+
+
+@lru_cache(maxsize=4096)
+def _text_path(text, size):
+    # Labels repeat across boxes and frames, and converting glyphs to paths is slow
+    if text.strip() == '':
+        return Path(np.empty((0, 2)))
+    return TextPath((0, 0), text, size=size)
+
+
+def label_collections(texts, positions, ax, text_p, text_box):
+    """ Create two collections drawing many text labels and their backgrounds.
+
+        Each label is converted to the outline of its glyphs with *TextPath* and all labels are
+    drawn by one collection at their positions, so the cost does not grow with one text artist
+    per label. Backgrounds are plain rectangles instead of the styles of *text_box*, and glyphs
+    are filled outlines without font hinting, so small labels look slightly softer than text.
+
+    Parameters
+    ----------
+    texts: list
+        Labels.
+    positions: numpy array
+        (x, y) data coordinates of the baseline start of each label, of shape (N,2).
+    ax: matplotlib.axes
+        Axes the collections are drawn in. Label sizes stay in points when zooming.
+    text_p: dict
+        Font attributes of labels. See *box_text_params*.
+    text_box: dict
+        Attributes of the label backgrounds. Only 'facecolor', 'alpha' and 'pad' are used.
+
+    Returns
+    -------
+    background: matplotlib.collections.PolyCollection
+    glyphs: matplotlib.collections.PathCollection
+    """
+    fontsize = text_p['fontsize']
+    paths = [_text_path(str(i), fontsize) for i in texts]
+    pad = text_box.get('pad', 0) * fontsize
+    # Bounds of the control points contain the glyphs and are much cheaper than exact extents
+    verts = []
+    for path in paths:
+        (x0, y0), (x1, y1) = (path.vertices.min(axis=0), path.vertices.max(axis=0)) \
+            if len(path.vertices) > 0 else ((0, 0), (0, 0))
+        verts.append([(x0 - pad, y0 - pad), (x1 + pad, y0 - pad),
+                      (x1 + pad, y1 + pad), (x0 - pad, y1 + pad)])
+
+    # Paths are in points from each offset, which is in data coordinates
+    points_to_pixels = Affine2D().scale(1 / 72) + ax.figure.dpi_scale_trans
+    offsets = np.asarray(positions, dtype=float).reshape(-1, 2)
+    background = PolyCollection(verts, closed=True, facecolors=text_box.get('facecolor', 'none'),
+                                edgecolors='none', alpha=text_box.get('alpha'), offsets=offsets,
+                                offset_transform=ax.transData)
+    glyphs = PathCollection(paths, facecolors=text_p['color'], edgecolors='none',
+                            offsets=offsets, offset_transform=ax.transData)
+    for collection in (background, glyphs):
+        collection.set_transform(points_to_pixels)
+        # Not clipped to the axes, like text artists
+        collection.set_clip_on(False)
+    return background, glyphs
+
+
 def bboxplot_in_img(img, bboxes, labels=None, mode='xyxy', box_attribs=None, text_attribs=None,
-                    fig=None, ax=None, return_fig=False, label_number=True):
+                    fig=None, ax=None, return_fig=False, label_number=True, fast=False,
+                    fast_labels=False):
     """
 
     Parameters
@@ -92,6 +365,13 @@ def bboxplot_in_img(img, bboxes, labels=None, mode='xyxy', box_attribs=None, tex
     label_number: bool
         Flag to add index of box when text labels are absent. Does not work when labels are
         provided.
+    fast: bool
+        Flag to draw all boxes as a single collection instead of one patch per box. Looks the same
+        but avoids the overhead of one artist per box.
+    fast_labels: bool
+        Flag to draw all labels with two collections instead of one text artist per box (see
+        *label_collections*). Drawing time barely grows with the number of labels, but labels
+        lose the rounded background and font hinting, so they do not look the same.
 
     Returns
     -------
@@ -101,24 +381,7 @@ def bboxplot_in_img(img, bboxes, labels=None, mode='xyxy', box_attribs=None, tex
     assert labels is None or len(bboxes) == len(labels), \
         f'Number of bounding boxes and labels mismatch: {len(bboxes)} vs {len(labels)}'
 
-    # Default values for text and box attributes
-    box_p = {'linewidth': 2,
-             'colors': ['r', 'g', 'b', 'y', 'brown', 'orange']}
-    text_p = {'fontsize': 8, 'color': 'black'}
-    text_box = {'facecolor': 'wheat', 'alpha': 0.5, 'pad': 0.1, 'boxstyle': 'round'}
-
-    # Update default text and box attributes with specified values
-    if box_attribs is not None:
-        for k, v in box_attribs.items():
-            assert k in box_p, f'Invalid key for box attribute: {k}'
-            box_p[k] = v
-    if text_attribs is not None:
-        for k, v in text_attribs.items():
-            if k != 'box':
-                assert k in text_p, f'Invalid key for text attribute: {k}'
-                text_p[k] = v
-            else:
-                text_box.update(v)
+    box_p, text_p, text_box = box_text_params(box_attribs, text_attribs)
 
     # Create a new plot if not provided
     if fig is None and ax is None:
@@ -134,17 +397,31 @@ def bboxplot_in_img(img, bboxes, labels=None, mode='xyxy', box_attribs=None, tex
             bboxes[:, 3] = bboxes[:, 3] - bboxes[:, 1]
 
         # Plot boxes
+        if fast:
+            # Keep the limits of the image like the patches do
+            ax.add_collection(box_collection(bboxes[:, :4], box_p['colors'],
+                                             linewidth=box_p['linewidth']), autolim=False)
         for idx, bbox in enumerate(bboxes):
-            rect = patches.Rectangle((bbox[0], bbox[1]), bbox[2], bbox[3],
-                                     linewidth=box_p['linewidth'],
-                                     edgecolor=box_p['colors'][idx % len(box_p['colors'])],
-                                     facecolor='none')
-            ax.add_patch(rect)
+            if not fast:
+                rect = patches.Rectangle((bbox[0], bbox[1]), bbox[2], bbox[3],
+                                         linewidth=box_p['linewidth'],
+                                         edgecolor=box_p['colors'][idx % len(box_p['colors'])],
+                                         facecolor='none')
+                ax.add_patch(rect)
+            if fast_labels:
+                continue
             if labels:
                 ax.text(bbox[0], max(bbox[1] - 5, 0), labels[idx], fontdict=text_p, bbox=text_box)
             elif label_number:
                 ax.text(bbox[0], max(bbox[1] - 5, 0), str(idx), fontdict=text_p, bbox=text_box)
 
+        # Plot labels
+        texts = labels if labels else range(len(bboxes)) if label_number else []
+        if fast_labels and len(texts) > 0:
+            positions = np.stack((bboxes[:, 0], np.maximum(bboxes[:, 1] - 5, 0)), axis=1)
+            for collection in label_collections(texts, positions, ax, text_p, text_box):
+                ax.add_collection(collection, autolim=False)
+
     if return_fig:
         return fig, ax
 
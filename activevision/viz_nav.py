@@ -1,13 +1,262 @@
 import os
-from PIL import Image
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib import patches
 
 from activevision.defaults import AVD_DATASET
-from activevision.annotations import AVDAnnotations, AVDCategoryAnns
-from activevision.utils.plot_utils import bboxplot_in_img
+from activevision.annotations import AVDAnnotations, AVDCategoryAnns, get_boxes_and_labels
+from activevision.frame_reader import FrameReader
+from activevision.utils.lru_cache import LRUCache
+from activevision.utils.plot_utils import box_text_params
 
+INPUT_MAP = {
+    'w': 'forward',
+    's': 'backward',
+    'a': 'rotate_ccw',
+    'd': 'rotate_cw',
+    'z': 'left',
+    'x': 'right'
+}
 
-def visualize_boxes_and_move(scene, box_type='instance', start_idx=0):
+
+def reachable_images(scene_ann, scene, img_name, depth=1):
+    """ Get images reachable from an image with at most `depth` moves, nearest first. """
+    visited = {img_name}
+    frontier = [img_name]
+    reachable = []
+    for _ in range(depth):
+        next_frontier = []
+        for name in frontier:
+            for direction in INPUT_MAP.values():
+                neighbor = scene_ann.get_neighbor_image(scene=scene, img_name=name,
+                                                        direction=direction)
+                if neighbor != '' and neighbor not in visited:
+                    visited.add(neighbor)
+                    next_frontier.append(neighbor)
+        reachable.extend(next_frontier)
+        frontier = next_frontier
+    return reachable
+
+
+class NavigationPrefetcher:
+    """ Decode frames and gather boxes of the images around the current one in the background.
+
+        Frames are decoded by the threads of a *FrameReader* and boxes are gathered in a separate
+    thread, while the current image is displayed.
+    """
+
+    def __init__(self, scene_ann, scene, box_type='instance', depth=1, reader=None,
+                 max_frames=64, frame_size=None):
+        """
+        Parameters
+        ----------
+        scene_ann: AVDAnnotations or AVDCategoryAnns
+            Annotations with the scene loaded.
+        scene: str
+            Name of the scene.
+        box_type: ('instance', 'category', 'both'), default='instance'
+            Type of boxes to display.
+        depth: int, default=1
+            Number of moves ahead to prefetch. No prefetching when 0.
+        reader: FrameReader or None, default=None
+            Reader of the frames. A reader of RGBA frames of size `frame_size` caching
+            `max_frames` is created when None.
+        max_frames: int, default=64
+            Maximum number of frames and boxes kept.
+        frame_size: tuple or None, default=None
+            (width, height) of frames when creating the reader. Full resolution when None.
+        """
+        self.scene_ann = scene_ann
+        self.scene = scene
+        self.box_type = box_type
+        self.depth = depth
+        if reader is None:
+            reader = FrameReader(scene_ann, size=frame_size, max_frames=max_frames, mode='RGBA')
+        self.reader = reader
+        self.boxes = LRUCache(loader=self._load_boxes, max_items=max_frames)
+        self._box_executor = ThreadPoolExecutor(max_workers=1)
+
+    def _load_boxes(self, img_name):
+        return get_boxes_and_labels(self.scene_ann, self.scene, img_name, box_type=self.box_type)
+
+    def get(self, img_name):
+        """ Get frame, boxes and labels of an image along with the size of its image file. """
+        bboxes, labels = self.boxes.get(img_name)
+        frame = self.reader.get(self.scene, img_name)
+        return frame, bboxes, labels, self.reader.source_size(self.scene, img_name)
+
+    def prefetch(self, img_name):
+        """ Start loading the images reachable from an image without waiting for them. """
+        if self.depth < 1:
+            return
+        names = reachable_images(self.scene_ann, self.scene, img_name, depth=self.depth)
+        self.reader.prefetch(self.scene, names)
+        for name in names:
+            if name not in self.boxes:
+                self._box_executor.submit(self.boxes.get, name)
+
+    def close(self):
+        """ Stop background loading. Frames being prefetched are still decoded. """
+        self._box_executor.shutdown(wait=False)
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class NavigationViewer:
+    """ Persistent figure for displaying frames with boxes one after another.
+
+        Keeps a single image artist updated with *set_data* and a pool of box and label artists
+    that are reused with updated geometry and hidden when unused, instead of clearing and
+    recreating the axes on every frame. When the canvas supports it, only the changing artists
+    are redrawn over a cached background (blitting).
+    """
+
+    def __init__(self, fig=None, ax=None, box_attribs=None, text_attribs=None, label_number=True,
+                 figsize=(16, 9), interpolation=None):
+        """
+        Parameters
+        ----------
+        fig: matplotlib.fig or None, default=None
+        ax: matplotlib.axes or None, default=None
+            Axes to draw on. A new figure of size `figsize` is created when both are None.
+        box_attribs: dict or None, default=None
+            Bounding box attributes. See *bboxplot_in_img*.
+        text_attribs: dict or None, default=None
+            Text box attributes. See *bboxplot_in_img*.
+        label_number: bool, default=True
+            Flag to label boxes with their index when labels are absent.
+        figsize: tuple, default=(16, 9)
+            Size of the created figure.
+        interpolation: str or None, default=None
+            Interpolation of the image artist. 'nearest' is faster for frames decoded close to the
+            display resolution. Matplotlib default when None.
+        """
+        if fig is None and ax is None:
+            fig, ax = plt.subplots(1, figsize=figsize)
+        self.fig = fig
+        self.ax = ax
+        self.box_p, self.text_p, self.text_box = box_text_params(box_attribs, text_attribs)
+        self.label_number = label_number
+        self.interpolation = interpolation
+        self.image = None
+        self.title = ax.set_title('')
+        self.rects = []
+        self.texts = []
+        self.last_render_ms = 0.
+
+        self.blit = bool(getattr(fig.canvas, 'supports_blit', False))
+        self._background = None
+        if self.blit:
+            self.title.set_animated(True)
+            self._draw_cid = fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _animated(self):
+        artists = [self.image, self.title] + self.rects + self.texts
+        return [i for i in artists if i is not None and i.get_visible()]
+
+    def _on_draw(self, event):
+        # Full redraw, e.g. after a resize, skips animated artists: cache it and draw them on top
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self._animated():
+            self.fig.draw_artist(artist)
+
+    def _grow_pool(self, num_boxes):
+        while len(self.rects) < num_boxes:
+            rect = patches.Rectangle((0, 0), 0, 0, linewidth=self.box_p['linewidth'],
+                                     facecolor='none', visible=False, animated=self.blit)
+            self.ax.add_patch(rect)
+            text = self.ax.text(0, 0, '', fontdict=self.text_p, bbox=self.text_box,
+                                visible=False, animated=self.blit, clip_on=True)
+            self.rects.append(rect)
+            self.texts.append(text)
+
+    def show(self, img, bboxes, labels=None, title='', image_size=None):
+        """ Display a frame with its boxes.
+
+        Parameters
+        ----------
+        img: PIL Image or numpy array
+            Image to display.
+        bboxes: list or numpy array
+            Bounding boxes in [x1, y1, x2, y2, ...] format.
+        labels: list or None, default=None
+            Labels of the boxes.
+        title: str, default=''
+            Title of the axes.
+        image_size: tuple or None, default=None
+            (width, height) of the pixel coordinates of the boxes. The image is stretched over it,
+            so a frame decoded at reduced resolution can be displayed with full resolution boxes.
+            Size of `img` when None.
+
+        Returns
+        -------
+        float
+            Time taken to render the frame in milliseconds.
+        """
+        start = time.perf_counter()
+        img = np.asarray(img)
+        full_redraw = self._background is None or not self.blit
+
+        imw, imh = (img.shape[1], img.shape[0]) if image_size is None else image_size
+        extent = (-0.5, imw - 0.5, imh - 0.5, -0.5)
+
+        if self.image is None:
+            self.image = self.ax.imshow(img, extent=extent, interpolation=self.interpolation,
+                                        animated=self.blit)
+            # Limits follow the image only, so boxes cannot invalidate the cached background
+            self.ax.set_autoscale_on(False)
+            full_redraw = True
+        else:
+            if tuple(self.image.get_extent()) != extent:
+                self.image.set_extent(extent)
+                self.ax.set_xlim(extent[0], extent[1])
+                self.ax.set_ylim(extent[2], extent[3])
+                full_redraw = True
+            self.image.set_data(img)
+
+        bboxes = np.array(bboxes, dtype=float) if len(bboxes) > 0 else np.empty((0, 4))
+        self._grow_pool(len(bboxes))
+        colors = self.box_p['colors']
+        for idx, (rect, text) in enumerate(zip(self.rects, self.texts)):
+            if idx >= len(bboxes):
+                rect.set_visible(False)
+                text.set_visible(False)
+                continue
+            x1, y1, x2, y2 = bboxes[idx, :4]
+            rect.set_bounds(x1, y1, x2 - x1, y2 - y1)
+            rect.set_edgecolor(colors[idx % len(colors)])
+            rect.set_visible(True)
+            if labels or self.label_number:
+                text.set_position((x1, max(y1 - 5, 0)))
+                text.set_text(labels[idx] if labels else str(idx))
+                text.set_visible(True)
+            else:
+                text.set_visible(False)
+        self.title.set_text(title)
+
+        canvas = self.fig.canvas
+        if full_redraw:
+            canvas.draw()
+        else:
+            canvas.restore_region(self._background)
+            for artist in self._animated():
+                self.fig.draw_artist(artist)
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+        self.last_render_ms = 1000 * (time.perf_counter() - start)
+        return self.last_render_ms
+
+
+def visualize_boxes_and_move(scene, box_type='instance', start_idx=0, prefetch_depth=1,
+                             frame_size=None):
     data_root = AVD_DATASET
     if box_type == 'instance':
         scene_ann = AVDAnnotations(data_root=data_root)
@@ -15,63 +264,41 @@ def visualize_boxes_and_move(scene, box_type='instance', start_idx=0):
         scene_ann = AVDCategoryAnns(data_root=data_root)
     scene_ann.load_annotations(scenes=[scene])
 
-    input_map = {
-        'w': 'forward',
-        's': 'backward',
-        'a': 'rotate_ccw',
-        'd': 'rotate_cw',
-        'z': 'left',
-        'x': 'right'
-    }
+    input_map = INPUT_MAP
 
     input_ = start_idx
-    fig, ax = plt.subplots(1, figsize=(16, 9))
-
-    while True:
-        try:
-            input_ = int(input_)
-            img_name = scene_ann.idx2image(scene=scene, idx=input_)
-        except ValueError:
-            if input_ == 'q':
-                print('Quitting')
-                break
-            elif input_ in input_map:
-                dir = input_map[input_]
-                next_img = scene_ann.get_neighbor_image(scene=scene, img_name=img_name,
-                                                        direction=dir)
-                if next_img == '':
-                    print(f'No image available in direction: **{dir}**! Try another command.')
-                else:
-                    img_name = next_img
-            else:
-                print(f'Invalid input! Possible inputs:\n{input_map}')
-                print('Or input a number < number of images in current scene or "q" to Quit.')
-
-        img_path = scene_ann.img_name2path(scene=scene, name=img_name)
-        img = Image.open(img_path)
-        if box_type == 'instance':
-            boxes_dict = scene_ann.get_image_boxes(scene, img_name)
-        else:
-            boxes_dict = scene_ann.get_image_boxes(scene, img_name, box_type=box_type)
+    viewer = NavigationViewer(interpolation=None if frame_size is None else 'nearest')
+    plt.show(block=False)
 
-        bboxes = []
-        labels = []
+    # Background threads are stopped however the loop ends, e.g. with Ctrl-C or an invalid index
+    with NavigationPrefetcher(scene_ann, scene, box_type=box_type, depth=prefetch_depth,
+                              frame_size=frame_size) as prefetcher:
+        while True:
+            try:
+                input_ = int(input_)
+                img_name = scene_ann.idx2image(scene=scene, idx=input_)
+            except ValueError:
+                if input_ == 'q':
+                    print('Quitting')
+                    break
+                elif input_ in input_map:
+                    dir = input_map[input_]
+                    next_img = scene_ann.get_neighbor_image(scene=scene, img_name=img_name,
+                                                            direction=dir)
+                    if next_img == '':
+                        print(f'No image available in direction: **{dir}**! Try another command.')
+                    else:
+                        img_name = next_img
+                else:
+                    print(f'Invalid input! Possible inputs:\n{input_map}')
+                    print('Or input a number < number of images in current scene or "q" to Quit.')
 
-        if box_type == 'instance' or box_type == 'both':
-            bboxes += list(boxes_dict['instance_boxes'])
-            labels += boxes_dict['instance_names']
-        if box_type == 'category' or box_type == 'both':
-            bboxes += list(boxes_dict['category_boxes'])
-            labels += boxes_dict['category_names']
+            img, bboxes, labels, image_size = prefetcher.get(img_name)
+            # Load possible next images while waiting for the input
+            prefetcher.prefetch(img_name)
 
-        plt.cla()
-        fig, ax = bboxplot_in_img(img, bboxes=bboxes,
-                                  labels=labels,
-                                  fig=fig, ax=ax, return_fig=True)
-        ax.set_title(img_name)
-        plt.draw()
-        plt.pause(0.01)
-        input_ = input('\nEnter command:  ')
+            viewer.show(img, bboxes=bboxes, labels=labels, title=img_name, image_size=image_size)
+            input_ = input('\nEnter command:  ')
 
 
 if __name__ == '__main__':
@@ -83,7 +310,14 @@ if __name__ == '__main__':
                         help='Type of bounding boxes to display')
     parser.add_argument('--idx', type=int, required=False, default=0,
                         help='Index to start visualizations from.')
+    parser.add_argument('--prefetch', type=int, required=False, default=1, choices=[0, 1, 2],
+                        help='Number of moves ahead to load images in the background.')
+    parser.add_argument('--size', type=int, nargs=2, required=False, default=None,
+                        metavar=('WIDTH', 'HEIGHT'),
+                        help='Decode frames at reduced resolution, e.g. 960 540. Boxes are still '
+                             'drawn at full resolution coordinates.')
 
     args = parser.parse_args()
 
-    visualize_boxes_and_move(scene=args.scene, box_type=args.type, start_idx=args.idx)
+    visualize_boxes_and_move(scene=args.scene, box_type=args.type, start_idx=args.idx,
+                             prefetch_depth=args.prefetch, frame_size=args.size)
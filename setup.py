@@ -28,7 +28,7 @@ setup(
     long_description_content_type="text/markdown",
     url='https://github.com/sulabh-shr/activevision.git',
     packages=find_packages(),
-    install_requires=['numpy', 'scipy', 'matplotlib', 'scikit-learn', 'pandas'],
+    install_requires=['numpy', 'scipy', 'matplotlib>=3.6', 'scikit-learn', 'pandas'],
     python_requires='>=3',
     classifiers=[
         "Programming Language :: Python :: 3",